@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from .models.parity import REPO_ROOT, TEST_IMAGES_DIR, list_images
+
+CATALOG_DIR = os.path.join(REPO_ROOT, "data", "system", "database")
+RESULTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "benchmark-results"
+)
+BENCH_PRODUCT_CODE = "BENCH-LOADTEST"
+DEFAULT_MIX = "deep=8,products=1,vectors=1"
+
+
+def labelled_images(root):
+    """``(product_code, bytes)`` for every ``root/<product_code>/<image>``."""
+    items = []
+    for path in list_images(root):
+        with open(path, "rb") as f:
+            items.append((os.path.relpath(path, root).split(os.sep, 1)[0], f.read()))
+    return items
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        raise ValueError(f"Unknown endpoints in mix: {', '.join(sorted(unknown))}")
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(latencies, statuses, duration):
+    ms = [seconds * 1000 for seconds in latencies]
+    errors = sum(count for status, count in statuses.items() if status >= 500)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / duration if duration else 0.0,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "mean_ms": sum(ms) / len(ms) if ms else None,
+        "max_ms": max(ms) if ms else None,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+async def _deep(client, images):
+    _, image = random.choice(images)
+    return await client.post(
+        "/deep", params={"k": 5}, files={"file": ("query.png", image, "image/png")}
+    )
+
+
+async def _products(client, images):
+    return await client.get("/products", params={"limit": 50})
+
+
+async def _vectors(client, images):
+    _, image = random.choice(images)
+    return await client.post(
+        "/products-vectors",
+        data={"product_code": BENCH_PRODUCT_CODE},
+        files={"files": ("upload.png", image, "image/png")},
+    )
+
+
+ENDPOINTS = {"deep": _deep, "products": _products, "vectors": _vectors}
+
+
+async def run_load(client, images, mix, concurrency=8, duration=30.0, requests=None):
+    """Drive the API with ``concurrency`` clients picking endpoints by ``mix``.
+
+    Stops after ``duration`` seconds, or after ``requests`` requests if given.
+    Client-side errors (timeouts, refused connections) are counted as
+    status 0.
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = {name: [] for name in names}
+    statuses = {name: {} for name in names}
+    budget = {"left": requests}
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            if budget["left"] is not None:
+                if budget["left"] <= 0:
+                    return
+                budget["left"] -= 1
+            name = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = (await ENDPOINTS[name](client, images)).status_code
+            except Exception:
+                status = 0
+            latencies[name].append(time.perf_counter() - start)
+            statuses[name][status] = statuses[name].get(status, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    total_statuses = {}
+    for counts in statuses.values():
+        for status, count in counts.items():
+            total_statuses[status] = total_statuses.get(status, 0) + count
+    return {
+        "duration_s": elapsed,
+        "total": summarize(
+            [s for values in latencies.values() for s in values],
+            total_statuses,
+            elapsed,
+        ),
+        "endpoints": {
+            name: summarize(latencies[name], statuses[name], elapsed) for name in names
+        },
+    }
+
+
+async def run_quality(client, queries, k=5, concurrency=4):
+    """recall@1 and recall@k of /deep against the product_code folder labels.
+
+    A query counts as a hit when its own product is among the first 1 (or
+    ``k``) products returned. "Image not match" answers count as misses.
+    Matches on the load test's own product are ignored: it holds copies of
+    the query images, which would otherwise match themselves.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def search(image):
+        async with semaphore:
+            response = await client.post(
+                "/deep",
+                params={"k": k},
+                files={"file": ("query.png", image, "image/png")},
+            )
+        if response.status_code != 200:
+            return []
+        return [
+            match["product_code"]
+            for match in response.json()["matches"]
+            if match["product_code"] != BENCH_PRODUCT_CODE
+        ]
+
+    results = await asyncio.gather(*(search(image) for _, image in queries))
+    hits_1 = sum(
+        1 for (label, _), codes in zip(queries, results) if codes[:1] == [label]
+    )
+    hits_k = sum(1 for (label, _), codes in zip(queries, results) if label in codes[:k])
+    return {
+        "queries": len(queries),
+        "recall@1": hits_1 / len(queries) if queries else None,
+        f"recall@{k}": hits_k / len(queries) if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def in_process_client(catalog):
+    """httpx client bound to the app itself, with the in-memory index seeded
+    from ``catalog`` in place of Postgres. Only the /deep endpoints work."""
+    import httpx
+    from .main import app
+    from . import inference
+    from .database import get_db
+    from .vector_index import index
+
+    async def no_db():
+        yield None
+
+    await inference.startup()
+    app.dependency_overrides[get_db] = no_db
+    # int8/float16 ต้อง rescore จาก DB จึงเก็บ float32 เต็มแทน
+    index.storage = "float32"
+    # ทีละ batch: catalog ใหญ่กว่า INFERENCE_MAX_PENDING จะได้ไม่โดน ExecutorBusyError
+    embeddings = await inference.embed_in_chunks(
+        inference.embed_image, [image for _, image in catalog]
+    )
+    index.build(
+        (f"bench-{i}", code, embedding.flatten())
+        for i, ((code, _), embedding) in enumerate(zip(catalog, embeddings))
+    )
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://benchmark")
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load-test the search API and measure retrieval quality"
+    )
+    parser.add_argument("--url", default="http://localhost:4345")
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="run the app in this process with an in-memory index instead of Postgres",
+    )
+    parser.add_argument(
+        "--seed",
+        action="store_true",
+        help="ingest data/system/database into the DATABASE_URL Postgres first",
+    )
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--requests", type=int, default=None)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--output", help="JSON result path (default: benchmark-results/)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        import httpx
+    except ImportError:
+        print("❌ benchmark ต้องติดตั้ง httpx ก่อน (pip install httpx)")
+        return 1
+
+    mix = parse_mix(args.mix)
+    catalog = labelled_images(CATALOG_DIR)
+    queries = labelled_images(TEST_IMAGES_DIR)
+
+    if args.in_process:
+        # ไม่มี Postgres: endpoint ที่ต้องใช้ DB จะถูกตัดออกจาก mix
+        mix = {name: weight for name, weight in mix.items() if name == "deep"}
+        client = await in_process_client(catalog)
+    else:
+        if args.seed:
+            from .ingest import ingest
+
+            await ingest(CATALOG_DIR)
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+
+    async with client:
+        if "vectors" in mix:
+            await client.post(
+                "/products",
+                json={
+                    "product_code": BENCH_PRODUCT_CODE,
+                    "product_name": "Load test",
+                    "price": 0,
+                    "quantity": 0,
+                },
+            )
+        try:
+            print(f"Load: {mix} x{args.concurrency} for {args.duration}s")
+            load = await run_load(
+                client,
+                queries or catalog,
+                mix,
+                args.concurrency,
+                args.duration,
+                args.requests,
+            )
+        finally:
+            if "vectors" in mix:
+                await client.delete(f"/products/{BENCH_PRODUCT_CODE}")
+        # วัดหลังลบภาพที่ load test อัปโหลด (ซึ่งก็คือภาพ query) ออกแล้ว ไม่ให้ match ตัวเอง
+        print("Quality: /deep on data/system/test")
+        quality = await run_quality(client, queries, args.k)
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "target": "in-process" if args.in_process else args.url,
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "mix": mix,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "requests": args.requests,
+            "k": args.k,
+        },
+        "load": load,
+        "quality": quality,
+    }
+
+    for name, stats in load["endpoints"].items():
+        print(
+            f"{name:<9} {stats['requests']:>6} req {stats['rps']:>8.1f} req/s"
+            f"  p50 {stats['p50_ms'] or 0:>7.1f}  p95 {stats['p95_ms'] or 0:>7.1f}"
+            f"  p99 {stats['p99_ms'] or 0:>7.1f} ms  errors {stats['errors']}"
+        )
+    print(
+        f"recall@1 {quality['recall@1']:.3f}  recall@{args.k} {quality[f'recall@{args.k}']:.3f}"
+        f" over {quality['queries']} queries"
+    )
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(
+            RESULTS_DIR, f"{stamp}-{result['commit'] or 'local'}.json"
+        )
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import torch
+from dotenv import load_dotenv
+from . import inference, metrics, vector_index
+from .models.batching import MicroBatcher
+from .models.cache import EmbeddingCache
+from .models.executor import ExecutorBusyError
+from .models.runtime import load_runtime
+from .models.utils import CONFIG, cosine_distance_to_percent
+from .products import CascadeVector
+from .versions import version_complete
+
+load_dotenv()
+
+# ว่างไว้ = ปิด cascade ทุก query ใช้ model เต็ม
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH") or None
+CASCADE_MODEL_RUNTIME = os.getenv("CASCADE_MODEL_RUNTIME", "eager")
+CASCADE_BACKBONE = os.getenv("CASCADE_BACKBONE", "mobilenet_v3_small")
+# vector ของ model เล็กเก็บเป็นแถวของ version นี้ใน cascade_image_vectors
+CASCADE_MODEL_VERSION = os.getenv("CASCADE_MODEL_VERSION", "small-v1")
+# similarity (%) ของสินค้าอันดับ 1 ต้องห่างจากอันดับ 2 อย่างน้อยเท่านี้ ไม่งั้นส่งต่อให้ model เต็ม
+CASCADE_MARGIN = float(os.getenv("CASCADE_MARGIN", "10"))
+# ระหว่าง re-index ของ model เล็ก ถามสถานะจาก DB ซ้ำไม่ถี่กว่านี้ (วินาที)
+VERSION_CHECK_SECONDS = 30
+
+# ค้นด้วย index ใน memory เท่านั้น ถ้าปิด ANN_INDEX ก็ไม่มี cascade
+enabled = CASCADE_MODEL_PATH is not None and vector_index.ANN_INDEX
+runtime = None
+loaded = False
+# index โหลดหลังจาก CASCADE_MODEL_VERSION re-index ครบแล้ว
+index_complete = False
+_version_checked_at = None
+_reload_task = None
+
+# model เล็กไม่ต้อง rescore จึงเก็บ float32 เสมอ
+index = vector_index.VectorIndex(
+    nprobe=vector_index.ANN_NPROBE,
+    nlist=vector_index.ANN_NLIST,
+    exact_threshold=vector_index.ANN_EXACT_THRESHOLD,
+)
+if enabled:
+    vector_index.register(index, CASCADE_MODEL_VERSION, CascadeVector)
+
+
+def _infer(batch):
+    return runtime(batch)
+
+
+# ใช้ thread เดียวกับ model เต็ม forward pass ของสอง model จึงไม่แย่ง core กัน
+batcher = MicroBatcher(
+    _infer,
+    max_batch_size=inference.BATCH_MAX_SIZE,
+    max_wait_ms=inference.BATCH_MAX_WAIT_MS,
+    executor=inference.model_executor,
+    name="small",
+)
+cache = EmbeddingCache(
+    max_entries=inference.EMBEDDING_CACHE_ENTRIES,
+    max_bytes=int(inference.EMBEDDING_CACHE_MAX_MB * 2**20),
+)
+
+QUERIES = metrics.registry.counter(
+    "cascade_queries_total",
+    "Searches answered by the small model or escalated to the full model",
+    ["outcome"],
+)
+
+
+def _escalation_rate():
+    escalated = QUERIES.value(outcome="escalated")
+    total = escalated + QUERIES.value(outcome="answered")
+    return escalated / total if total else 0.0
+
+
+metrics.registry.gauge(
+    "cascade_escalation_rate",
+    "Share of cascade searches that needed the full model",
+    _escalation_rate,
+)
+
+
+async def _reload_index():
+    global index_complete, _reload_task
+    try:
+        await vector_index.load_from_db(index, CASCADE_MODEL_VERSION, CascadeVector)
+        index_complete = True
+    finally:
+        _reload_task = None
+
+
+async def ready():
+    """True when the small model is loaded and its index holds the whole
+    ``CASCADE_MODEL_VERSION`` catalog.
+
+    While that version is still being re-indexed the cascade stays off: an
+    incomplete catalog can answer confidently with the wrong product. Once
+    the version is complete the index is reloaded in the background,
+    because it may have been loaded mid re-index.
+    """
+    global _version_checked_at, _reload_task
+    # ยังไม่มี vector ของ model เล็ก (เช่นยังไม่ได้ re-index) ก็ข้าม cascade ไป
+    if not (loaded and index.ready and len(index) > 0):
+        return False
+    if index_complete:
+        return True
+    now = time.monotonic()
+    if _reload_task is not None or (
+        _version_checked_at is not None
+        and now - _version_checked_at < VERSION_CHECK_SECONDS
+    ):
+        return False
+    _version_checked_at = now
+    try:
+        complete = await version_complete(CASCADE_MODEL_VERSION)
+    except Exception:
+        return False
+    if complete:
+        _reload_task = asyncio.get_running_loop().create_task(_reload_index())
+    return False
+
+
+def margin(matches):
+    """Similarity points between the best product and the runner-up."""
+    if not matches:
+        return 0.0
+    best = cosine_distance_to_percent(matches[0].distance)
+    if len(matches) < 2:
+        return best
+    return best - cosine_distance_to_percent(matches[1].distance)
+
+
+async def embed_image(image_bytes: bytes, decoded=None):
+    """Small-model embedding of ``image_bytes``. When the image has to be
+    decoded, the tensor is left in ``decoded["tensor"]`` for the full model."""
+    if not loaded:
+        raise ExecutorBusyError("Model is still loading, try again shortly")
+
+    async def compute(data):
+        with inference.executor.slot():
+            tensor = await inference.decode_image(data)
+            if decoded is not None:
+                decoded["tensor"] = tensor
+            embedding = await batcher.submit(tensor)
+        return embedding.numpy().copy()
+
+    return await cache.get_or_compute(image_bytes, compute)
+
+
+async def search(image_bytes: bytes, k=5, nprobe=None, min_similarity=50):
+    """Try to answer a search with the small model.
+
+    Returns ``(matches, None)`` when the best product is a match and beats
+    the runner-up by at least ``CASCADE_MARGIN``; otherwise ``(None,
+    tensor)`` so the caller can run the full model on the already decoded
+    image (``tensor`` is ``None`` if the embedding came from the cache).
+    """
+    decoded = {}
+    embedding = await embed_image(image_bytes, decoded)
+    with metrics.timed("small_search"):
+        matches = index.search_products(embedding.flatten(), k=max(k, 2), nprobe=nprobe)
+    confident = (
+        bool(matches)
+        and cosine_distance_to_percent(matches[0].distance) >= min_similarity
+        and margin(matches) >= CASCADE_MARGIN
+    )
+    if confident:
+        QUERIES.inc(outcome="answered")
+        return matches[:k], None
+    QUERIES.inc(outcome="escalated")
+    return None, decoded.get("tensor")
+
+
+def _warmup_forward(iterations):
+    for batch_size in sorted({1, inference.BATCH_MAX_SIZE}):
+        batch = torch.zeros(batch_size, 3, *CONFIG["IMAGE_SIZE"])
+        for _ in range(iterations):
+            runtime(batch)
+
+
+async def startup():
+    """Load and warm up the small model when the cascade is configured."""
+    global runtime, loaded
+    if not enabled:
+        return
+    started = time.perf_counter()
+    runtime = await asyncio.to_thread(
+        load_runtime,
+        CASCADE_MODEL_RUNTIME,
+        path=CASCADE_MODEL_PATH,
+        device=inference.device,
+        backbone=CASCADE_BACKBONE,
+    )
+    if inference.MODEL_WARMUP_ITERATIONS > 0:
+        await asyncio.get_running_loop().run_in_executor(
+            inference.model_executor, _warmup_forward, inference.MODEL_WARMUP_ITERATIONS
+        )
+    loaded = True
+    print(
+        f"✅ Cascade model ready ({CASCADE_BACKBONE}, {CASCADE_MODEL_VERSION}):"
+        f" {time.perf_counter() - started:.3f}s"
+    )
+
+
+async def shutdown():
+    await batcher.stop()
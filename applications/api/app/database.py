@@ -1,7 +1,14 @@
 import os
+import json
+import time
+import random
+import logging
+from sqlalchemy import event, func, select
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from dotenv import load_dotenv
+from . import metrics
 
 load_dotenv()
 
@@ -11,10 +18,81 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in the environment variables.")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+SQL_LOG_SAMPLE_RATE = float(os.getenv("SQL_LOG_SAMPLE_RATE", "0.01"))
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "200"))
+
+logger = logging.getLogger("app.sql")
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+QUERY_SECONDS = metrics.registry.histogram(
+    "db_query_duration_seconds", "Time spent executing SQL statements"
+)
+POOL_WAIT_SECONDS = metrics.registry.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled DB connection"
+)
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    # วัดเวลารอ connection จาก pool (รวมเวลาเปิด connection ใหม่ถ้า pool ยังไม่เต็ม)
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            elapsed = time.perf_counter() - start
+            POOL_WAIT_SECONDS.observe(elapsed)
+            metrics.record("db_pool", elapsed)
+
+
+engine = create_async_engine(DATABASE_URL, poolclass=TimedPool)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+metrics.registry.gauge(
+    "db_pool_checked_out",
+    "DB connections currently checked out",
+    lambda: engine.pool.checkedout(),
+)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    QUERY_SECONDS.observe(elapsed)
+    metrics.record("db", elapsed)
+
+    # แทน echo=True: log แบบสุ่มตัวอย่าง + query ที่ช้าเกิน SQL_SLOW_MS ทุกตัว
+    slow = elapsed * 1000 >= SQL_SLOW_MS
+    if slow or random.random() < SQL_LOG_SAMPLE_RATE:
+        logger.info(
+            json.dumps(
+                {
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "slow": slow,
+                    "executemany": executemany,
+                    "statement": " ".join(statement.split())[:500],
+                }
+            )
+        )
+
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def lock_image_keys(db, image_keys):
+    """Take a transaction-scoped advisory lock on each image store key.
+
+    Everything that stores, re-points or deletes image files holds these
+    locks until its commit, across all workers and CLI jobs.
+    """
+    # เรียงลำดับ key ก่อนเพื่อกัน deadlock ระหว่าง transaction ที่ lock หลาย key
+    for key in sorted(set(image_keys)):
+        await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(key))))
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from .models.parity import REPO_ROOT, TEST_IMAGES_DIR, embed_paths, list_images
+from .models.runtime import RUNTIMES, load_runtime
+from .vector_index import STORAGE_DTYPES, VectorIndex, rescore
+
+CATALOG_DIR = os.path.join(REPO_ROOT, "data", "system", "database")
+
+
+def load_split(runtime, root):
+    """Embed every ``root/<product_code>/<image>`` and return (codes, paths, vectors)."""
+    paths = list_images(root)
+    codes = [os.path.relpath(path, root).split(os.sep, 1)[0] for path in paths]
+    vectors = embed_paths(runtime, paths).numpy() if paths else np.empty((0, 128))
+    return codes, paths, vectors
+
+
+def _product_sets(results):
+    return [{match.product_code for match in matches} for matches in results]
+
+
+def _recall(results, truth):
+    found = _product_sets(results)
+    return float(np.mean([len(a & b) / max(1, len(b)) for a, b in zip(found, truth)]))
+
+
+def evaluate(items, queries, labels, k=5, rescore_factor=4):
+    """Compare every in-memory storage against exact float32 search.
+
+    ``recall`` is the overlap of the top-``k`` products with the float32
+    answer; ``rescored`` re-ranks ``k * rescore_factor`` candidates with the
+    full-precision vectors, as the API does for int8.
+    """
+    exact = VectorIndex(exact_threshold=len(items) + 1)
+    exact.build(items)
+    truth = _product_sets(exact.search_products_many(queries, k=k))
+    full = {str(id): vector for id, _, vector in items}
+
+    rows = []
+    for storage in STORAGE_DTYPES:
+        index = VectorIndex(storage=storage, exact_threshold=len(items) + 1)
+        index.build(items)
+        first_pass = index.search_products_many(queries, k=k)
+        candidates = index.search_products_many(queries, k=k * rescore_factor)
+        rescored = rescore(queries, candidates, full, k)
+
+        top1 = [matches[0].product_code if matches else None for matches in rescored]
+        rows.append(
+            {
+                "storage": storage,
+                "bytes_per_vector": index.nbytes / max(1, len(index)),
+                "index_bytes": int(index.nbytes),
+                "saved": 1 - index.nbytes / exact.nbytes,
+                "recall": _recall(first_pass, truth),
+                "recall_rescored": _recall(rescored, truth),
+                "top1_accuracy": float(np.mean([a == b for a, b in zip(top1, labels)])),
+            }
+        )
+    return rows
+
+
+def pgvector_bytes(dim, count):
+    # ขนาดข้อมูลต่อ vector ของ pgvector: vector = 4*dim + 8, halfvec = 2*dim + 8 bytes
+    return {
+        "vector": (4 * dim + 8) * count,
+        "halfvec": (2 * dim + 8) * count,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report memory and recall@k of compact embedding storage"
+    )
+    parser.add_argument("--catalog", default=CATALOG_DIR)
+    parser.add_argument("--queries", default=TEST_IMAGES_DIR)
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--runtime", choices=sorted(RUNTIMES), default="eager")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--report", help="write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    runtime = load_runtime(args.runtime, path=args.weights)
+    codes, paths, vectors = load_split(runtime, args.catalog)
+    labels, _, queries = load_split(runtime, args.queries)
+    if not len(vectors) or not len(queries):
+        print("❌ Need images in both the catalog and the query split")
+        return 1
+
+    items = list(zip(paths, codes, vectors))
+    rows = evaluate(items, queries, labels, args.k, args.rescore_factor)
+    pg = pgvector_bytes(vectors.shape[1], len(vectors))
+
+    print(f"{len(items)} catalog images, {len(queries)} queries, k={args.k}")
+    print(
+        f"{'storage':<8} {'B/vector':>9} {'saved':>7} {'recall':>7}"
+        f" {'rescored':>9} {'top1':>6}"
+    )
+    for row in rows:
+        print(
+            f"{row['storage']:<8} {row['bytes_per_vector']:>9.0f} {row['saved']:>7.1%}"
+            f" {row['recall']:>7.3f} {row['recall_rescored']:>9.3f}"
+            f" {row['top1_accuracy']:>6.3f}"
+        )
+    print(
+        f"pgvector: vector {pg['vector'] / 2**20:.2f} MB,"
+        f" halfvec {pg['halfvec'] / 2**20:.2f} MB"
+        f" ({1 - pg['halfvec'] / pg['vector']:.1%} saved)"
+    )
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(
+                {
+                    "k": args.k,
+                    "catalog_images": len(items),
+                    "queries": len(queries),
+                    "in_memory": rows,
+                    "pgvector_bytes": pg,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
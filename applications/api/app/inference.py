@@ -0,0 +1,191 @@
+import os
+import time
+import logging
+import asyncio
+import torch
+from io import BytesIO
+from PIL import Image
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from .models.runtime import load_runtime, threads_per_worker
+from .models.cache import EmbeddingCache
+from .models.batching import MicroBatcher
+from .models.executor import ExecutorBusyError, InferenceExecutor
+from .models.utils import CONFIG, timed_image_to_tensor
+from . import metrics
+
+load_dotenv()
+
+MODEL_RUNTIME = os.getenv("MODEL_RUNTIME", "eager")
+MODEL_PATH = os.getenv("MODEL_PATH") or None
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "2"))
+INFERENCE_POOL = os.getenv("INFERENCE_POOL", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0")) or None
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "64"))
+EMBEDDING_CACHE_ENTRIES = int(os.getenv("EMBEDDING_CACHE_ENTRIES", "1024"))
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "16"))
+
+logger = logging.getLogger("app.inference")
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+MODEL_WARMUP_ITERATIONS = int(os.getenv("MODEL_WARMUP_ITERATIONS", "3"))
+# uvicorn --workers อ่านค่า default จาก WEB_CONCURRENCY เช่นกัน
+API_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0")) or threads_per_worker(
+    API_WORKERS
+)
+
+# แบ่ง core ให้แต่ละ worker ไม่ให้ทุก worker ใช้ทุก core จน oversubscribe
+torch.set_num_threads(TORCH_NUM_THREADS)
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    # ตั้งได้ครั้งเดียวก่อน torch เริ่มงาน parallel (เช่นตอน reload)
+    pass
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# โหลด model ใน lifespan (startup()) ไม่ใช่ตอน import
+runtime = None
+ready = False
+cold_start = {}
+
+
+# decode/preprocess รันใน pool ที่ตั้งค่าได้ ส่วน forward pass รันใน thread เดียว
+# (torch กระจายงานข้าม core เองอยู่แล้ว)
+executor = InferenceExecutor(
+    kind=INFERENCE_POOL,
+    workers=INFERENCE_WORKERS or min(4, TORCH_NUM_THREADS),
+    max_pending=INFERENCE_MAX_PENDING,
+)
+model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+
+
+def _infer(batch):
+    return runtime(batch)
+
+
+batcher = MicroBatcher(
+    _infer,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    executor=model_executor,
+)
+
+cache = EmbeddingCache(
+    max_entries=EMBEDDING_CACHE_ENTRIES,
+    max_bytes=int(EMBEDDING_CACHE_MAX_MB * 2**20),
+)
+
+
+metrics.registry.gauge(
+    "inference_batch_queue_depth",
+    "Images waiting for the next batched forward pass",
+    lambda: batcher.pending,
+)
+metrics.registry.gauge(
+    "inference_pending",
+    "Images admitted to the inference pipeline",
+    lambda: executor.pending,
+)
+
+
+async def decode_image(image_bytes: bytes):
+    start = time.perf_counter()
+    tensor, decode, preprocess = await executor.run(timed_image_to_tensor, image_bytes)
+    metrics.record("decode", decode)
+    metrics.record("preprocess", preprocess)
+    # เวลาที่รอ worker ว่าง (รวม overhead ส่งข้อมูลข้าม process ถ้าใช้ process pool)
+    metrics.record("pool_wait", time.perf_counter() - start - decode - preprocess)
+    return tensor
+
+
+async def _compute_embedding(image_bytes: bytes, tensor=None):
+    with executor.slot():
+        if tensor is None:
+            tensor = await decode_image(image_bytes)
+        embedding = await batcher.submit(tensor)
+    # copy เพื่อไม่ให้ cache ถือ tensor ของทั้ง batch ไว้
+    return embedding.numpy().copy()
+
+
+async def embed_image(image_bytes: bytes, tensor=None):
+    """Full-model embedding of ``image_bytes``; pass ``tensor`` when the image
+    was already decoded (e.g. by the cascade) to skip decoding it again."""
+    if not ready:
+        raise ExecutorBusyError("Model is still loading, try again shortly")
+    # ภาพที่ถูกส่งซ้ำ (retry จากเครื่องสแกน/มือถือ) ไม่ต้องผ่าน model อีก
+    return await cache.get_or_compute(
+        image_bytes, lambda data: _compute_embedding(data, tensor)
+    )
+
+
+async def embed_in_chunks(embed, images):
+    """``embed`` every image, at most one model batch in flight at a time.
+
+    ``embed`` is ``embed_image`` or the cascade's; keeps a single caller from
+    taking more than ``INFERENCE_MAX_PENDING`` executor slots.
+    """
+    # ส่งทีละก้อนขนาด batch ของ model ให้ batcher รวมเป็น forward pass เต็ม batch
+    embeddings = []
+    for start in range(0, len(images), batcher.max_batch_size):
+        chunk = images[start : start + batcher.max_batch_size]
+        embeddings += await asyncio.gather(*(embed(b) for b in chunk))
+    return embeddings
+
+
+def _warmup_image():
+    buffer = BytesIO()
+    Image.new("RGB", (640, 480), (127, 127, 127)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def _warmup_forward(iterations):
+    # รันทั้ง batch เล็กและ batch เต็ม ให้ allocator/kernel cache พร้อมทั้งสองขนาด
+    for batch_size in sorted({1, BATCH_MAX_SIZE}):
+        batch = torch.zeros(batch_size, 3, *CONFIG["IMAGE_SIZE"])
+        for _ in range(iterations):
+            runtime(batch)
+
+
+async def startup():
+    """Load the model runtime and warm it up; sets ``ready`` when done."""
+    global runtime, ready
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    runtime = await asyncio.to_thread(
+        load_runtime, MODEL_RUNTIME, path=MODEL_PATH, device=device
+    )
+    loaded = time.perf_counter()
+
+    if MODEL_WARMUP_ITERATIONS > 0:
+        # forward pass ต้องรันใน thread เดียวกับตอนให้บริการจริง
+        await loop.run_in_executor(
+            model_executor, _warmup_forward, MODEL_WARMUP_ITERATIONS
+        )
+        # ให้ pool ของ decode/preprocess สร้าง worker (และ import torch ถ้าเป็น process pool)
+        await executor.run(timed_image_to_tensor, _warmup_image())
+    finished = time.perf_counter()
+
+    cold_start.update(
+        runtime=MODEL_RUNTIME,
+        torch_threads=torch.get_num_threads(),
+        load_seconds=round(loaded - started, 3),
+        warmup_seconds=round(finished - loaded, 3),
+        total_seconds=round(finished - started, 3),
+    )
+    ready = True
+    logger.info(
+        "✅ Model ready (%s): load %ss, warmup %ss",
+        MODEL_RUNTIME,
+        cold_start["load_seconds"],
+        cold_start["warmup_seconds"],
+    )
+
+
+async def shutdown():
+    await batcher.stop()
+    executor.shutdown()
+    model_executor.shutdown(wait=False, cancel_futures=True)
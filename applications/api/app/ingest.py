@@ -0,0 +1,331 @@
+import os
+import csv
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import multiprocessing
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import asyncpg
+import numpy as np
+import torch
+from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+from pgvector.asyncpg import register_vector
+from .database import DATABASE_URL
+from .storage import ImageStore, image_store
+from .models.utils import image_to_tensor
+from .models.model import BACKBONES
+from .models.runtime import RUNTIMES, load_runtime, available_cores
+from .models.parity import REPO_ROOT, list_images
+from .versions import MODEL_VERSION
+
+load_dotenv()
+
+# ตั้งเหมือน API: เมื่อเปิด cascade ภาพใหม่ต้องมี vector ของ model เล็กด้วย
+# ไม่งั้น catalog ของ model เล็กจะขาดภาพไปโดยที่ยังถูกนับว่า complete
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH") or None
+CASCADE_MODEL_RUNTIME = os.getenv("CASCADE_MODEL_RUNTIME", "eager")
+CASCADE_BACKBONE = os.getenv("CASCADE_BACKBONE", "mobilenet_v3_small")
+CASCADE_MODEL_VERSION = os.getenv("CASCADE_MODEL_VERSION", "small-v1")
+CASCADE_TABLE = "cascade_image_vectors"
+
+DEFAULT_ROOT = os.path.join(REPO_ROOT, "data", "system", "database")
+VECTOR_COLUMNS = [
+    "id",
+    "product_code",
+    "embeded",
+    "image_key",
+    "model_version",
+    "created_at",
+]
+PRODUCT_COLUMNS = [
+    "product_code",
+    "product_name",
+    "description",
+    "price",
+    "quantity",
+    "category",
+    "unit",
+    "shelf",
+]
+
+
+def _init_worker():
+    # แต่ละ process decode ภาพเดียวทีละภาพ ไม่ต้องให้ torch แตก thread เพิ่ม
+    torch.set_num_threads(1)
+
+
+def _hash_file(path):
+    with open(path, "rb") as f:
+        return ImageStore.key_for(f.read())
+
+
+def _load_image(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    # decode ก่อน put ไฟล์เสียจะได้ไม่ค้างอยู่ใน image store
+    tensor = image_to_tensor(data).numpy()
+    return image_store.put(data), tensor
+
+
+def walk_catalog(root):
+    """``(product_code, path)`` for every image under ``root/<product_code>/``."""
+    items = []
+    for path in list_images(root):
+        relative = os.path.relpath(path, root)
+        product_code = relative.split(os.sep, 1)[0]
+        if product_code != relative:
+            items.append((product_code, path))
+    return items
+
+
+def read_products_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["product_code"]: row for row in csv.DictReader(f)}
+
+
+def product_record(product_code, metadata):
+    # สินค้าที่ไม่มีใน CSV ใช้ product_code เป็นชื่อ และ price/quantity เป็น 0 ไว้แก้ทีหลังใน panel
+    row = metadata.get(product_code, {})
+    return (
+        product_code,
+        row.get("product_name") or product_code,
+        row.get("description") or None,
+        float(row.get("price") or 0),
+        int(row.get("quantity") or 0),
+        row.get("category") or None,
+        row.get("unit") or None,
+        row.get("shelf") or None,
+    )
+
+
+def asyncpg_dsn(url):
+    return (
+        make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+    )
+
+
+async def _existing_keys(conn, table, model_version):
+    return {
+        (row["product_code"], row["image_key"])
+        for row in await conn.fetch(
+            f"SELECT product_code, image_key FROM {table}"
+            " WHERE image_key IS NOT NULL AND model_version = $1",
+            model_version,
+        )
+    }
+
+
+async def ingest(
+    root=DEFAULT_ROOT,
+    batch_size=64,
+    workers=None,
+    runtime_name="eager",
+    model_path=None,
+    products_csv=None,
+    model_version=MODEL_VERSION,
+    backbone="resnet18",
+    table="product_image_vectors",
+    cascade=None,
+):
+    """Embed and bulk-load every image under ``root`` that is not in ``table`` yet.
+
+    ``cascade`` is ``(runtime_name, model_path, backbone, model_version)`` of
+    the cascade's small model; when given, the same images are also embedded
+    with it into cascade_image_vectors (including ones missing there from
+    earlier runs), so both catalogs stay complete.
+
+    Files are matched by content hash per product, so an interrupted run can
+    simply be started again; each batch is committed by its own COPY.
+    Images that cannot be read or decoded are reported and skipped.
+    Returns ``(ingested, skipped)``.
+    """
+    items = walk_catalog(root)
+    metadata = read_products_csv(products_csv) if products_csv else {}
+    workers = workers or available_cores()
+    print(f"Found {len(items)} images of {len({c for c, _ in items})} products")
+
+    conn = await asyncpg.connect(asyncpg_dsn(DATABASE_URL))
+    await register_vector(conn)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    try:
+        existing = await _existing_keys(conn, table, model_version)
+        small_existing = None
+        if cascade is not None:
+            small_existing = await _existing_keys(conn, CASCADE_TABLE, cascade[3])
+        keys = pool.map(_hash_file, [path for _, path in items], chunksize=32)
+        todo = []
+        for (product_code, path), key in zip(items, keys):
+            # (ต้องใส่ตารางหลัก, ต้องใส่ตารางของ model เล็ก)
+            needs = (
+                (product_code, key) not in existing,
+                small_existing is not None
+                and (product_code, key) not in small_existing,
+            )
+            if any(needs):
+                existing.add((product_code, key))
+                if small_existing is not None:
+                    small_existing.add((product_code, key))
+                todo.append((product_code, path, needs))
+        print(f"Skipping {len(items) - len(todo)} images already ingested")
+        if not todo:
+            return 0, 0
+
+        products = sorted({product_code for product_code, _, _ in todo})
+        await conn.executemany(
+            f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}, created_at, updated_at)"
+            " VALUES ($1, $2, $3, $4, $5, $6, $7, $8, now(), now())"
+            " ON CONFLICT (product_code) DO NOTHING",
+            [product_record(product_code, metadata) for product_code in products],
+        )
+
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        runtime = load_runtime(
+            runtime_name, path=model_path, device=device, backbone=backbone
+        )
+        targets = [(runtime, table, model_version)]
+        if cascade is not None:
+            small_runtime, small_path, small_backbone, small_version = cascade
+            small = load_runtime(
+                small_runtime, path=small_path, device=device, backbone=small_backbone
+            )
+            targets.append((small, CASCADE_TABLE, small_version))
+
+        chunks = deque(
+            todo[start : start + batch_size]
+            for start in range(0, len(todo), batch_size)
+        )
+        in_flight = deque()
+        done = skipped = 0
+        started = time.perf_counter()
+        while chunks or in_flight:
+            # decode ชุดถัดไปล่วงหน้าใน process pool ระหว่างที่ model ประมวลผลชุดปัจจุบัน
+            while chunks and len(in_flight) < 2:
+                chunk = chunks.popleft()
+                futures = [pool.submit(_load_image, path) for _, path, _ in chunk]
+                in_flight.append((chunk, futures))
+
+            chunk, futures = in_flight.popleft()
+            loaded = []
+            for (product_code, path, needs), future in zip(chunk, futures):
+                try:
+                    key, tensor = future.result()
+                except Exception as e:
+                    # ไฟล์เสียไฟล์เดียวไม่ควรทำให้ทั้ง run ล้ม ข้ามไปแล้วรายงานตอนจบ
+                    print(f"⚠️  Skipping {path}: {e}")
+                    skipped += 1
+                    continue
+                loaded.append((product_code, key, tensor, needs))
+
+            now = datetime.now()
+            for target, (model, target_table, target_version) in enumerate(targets):
+                rows = [row for row in loaded if row[3][target]]
+                if not rows:
+                    continue
+                batch = torch.from_numpy(np.stack([tensor for _, _, tensor, _ in rows]))
+                embeddings = model(batch).numpy()
+                await conn.copy_records_to_table(
+                    target_table,
+                    records=[
+                        (
+                            uuid.uuid4(),
+                            product_code,
+                            embedding,
+                            key,
+                            target_version,
+                            now,
+                        )
+                        for (product_code, key, _, _), embedding in zip(
+                            rows, embeddings
+                        )
+                    ],
+                    columns=VECTOR_COLUMNS,
+                )
+
+            done += len(loaded)
+            elapsed = time.perf_counter() - started
+            print(
+                f"✅ {done + skipped}/{len(todo)} images"
+                f" ({done / elapsed:.1f} images/s, {skipped} skipped)"
+            )
+        return done, skipped
+    finally:
+        pool.shutdown(cancel_futures=True)
+        await conn.close()
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Bulk-load a <product_code>/<image> directory tree into the catalog"
+    )
+    parser.add_argument("root", nargs="?", default=DEFAULT_ROOT)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--runtime",
+        choices=sorted(RUNTIMES),
+        default=os.getenv("MODEL_RUNTIME", "eager"),
+    )
+    parser.add_argument("--model-path", default=os.getenv("MODEL_PATH") or None)
+    parser.add_argument("--model-version", default=MODEL_VERSION)
+    parser.add_argument(
+        "--backbone",
+        choices=sorted(BACKBONES),
+        default="resnet18",
+        help="architecture of eager weights (mobilenet_v3_small for the cascade model)",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="store small-model vectors in cascade_image_vectors",
+    )
+    parser.add_argument(
+        "--products-csv",
+        help="optional CSV with product_code,product_name,price,quantity,... columns",
+    )
+    args = parser.parse_args(argv)
+
+    cascade = None
+    if CASCADE_MODEL_PATH and not args.cascade:
+        cascade = (
+            CASCADE_MODEL_RUNTIME,
+            CASCADE_MODEL_PATH,
+            CASCADE_BACKBONE,
+            CASCADE_MODEL_VERSION,
+        )
+        print(f"Cascade enabled: also storing {CASCADE_MODEL_VERSION} vectors")
+
+    started = time.perf_counter()
+    done, skipped = await ingest(
+        args.root,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        runtime_name=args.runtime,
+        model_path=args.model_path,
+        products_csv=args.products_csv,
+        model_version=args.model_version,
+        backbone=args.backbone,
+        table=CASCADE_TABLE if args.cascade else "product_image_vectors",
+        cascade=cascade,
+    )
+    elapsed = time.perf_counter() - started
+    print(f"Done: {done} images in {elapsed:.1f}s ({done / elapsed:.1f} images/s)")
+    if skipped:
+        print(f"⚠️  {skipped} images could not be read and were skipped (see above)")
+    if done:
+        print(
+            "   API จะเห็นภาพใหม่ใน vector index หลัง refresh รอบถัดไป (ANN_REFRESH_SECONDS)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,6 +1,10 @@
+import time
+import asyncio
 import uvicorn
 from .products import Base
 from .database import engine
+from . import cascade, inference, vector_index
+from .metrics import MetricsMiddleware
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from .routes import router as products_router
@@ -10,10 +14,18 @@ from fastapi.middleware.cors import CORSMiddleware
 # DB Connection
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    started = time.perf_counter()
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # โหลด model กับ vector index พร้อมกัน
+    await asyncio.gather(vector_index.start(), inference.startup(), cascade.startup())
+    app.state.startup_seconds = round(time.perf_counter() - started, 3)
+    print(f"✅ API ready in {app.state.startup_seconds}s")
     yield
 
+    await vector_index.stop()
+    await cascade.shutdown()
+    await inference.shutdown()
     await engine.dispose()
 
 
@@ -29,7 +41,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(products_router)
 
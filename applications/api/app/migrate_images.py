@@ -0,0 +1,92 @@
+import sys
+import time
+import base64
+import asyncio
+import argparse
+from sqlalchemy import select, update
+from .database import AsyncSessionLocal, engine, lock_image_keys
+from .products import ProductVector
+from .storage import image_store
+
+
+def _decode_base64(image_base64: str):
+    data = base64.b64decode(image_base64)
+    return data, image_store.key_for(data)
+
+
+async def migrate(batch_size=200, keep_base64=False):
+    """Move base64 images out of product_image_vectors.image into the image store.
+
+    Works in batches of ``batch_size`` rows, each committed on its own, so
+    the job can be stopped and resumed at any time.
+    """
+    moved = 0
+    last_id = None
+    started = time.perf_counter()
+    while True:
+        async with AsyncSessionLocal() as db:
+            stmt = (
+                select(ProductVector.id, ProductVector.image)
+                .where(
+                    ProductVector.image_key.is_(None), ProductVector.image.is_not(None)
+                )
+                .order_by(ProductVector.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            if last_id is not None:
+                stmt = stmt.where(ProductVector.id > last_id)
+            rows = (await db.execute(stmt)).all()
+            if not rows:
+                break
+
+            decoded = await asyncio.gather(
+                *(asyncio.to_thread(_decode_base64, row.image) for row in rows)
+            )
+            # lock เดียวกับ upload/delete ของ API: การลบไฟล์ที่ไม่มีใครอ้างถึง
+            # จะรอจน batch นี้ commit แถวที่ชี้ไปยังไฟล์ก่อน
+            await lock_image_keys(db, [key for _, key in decoded])
+            keys = await asyncio.gather(
+                *(asyncio.to_thread(image_store.put, data) for data, _ in decoded)
+            )
+            values = []
+            for row, key in zip(rows, keys):
+                value = {"id": row.id, "image_key": key}
+                if not keep_base64:
+                    value["image"] = None
+                values.append(value)
+            await db.execute(update(ProductVector), values)
+            await db.commit()
+
+        moved += len(rows)
+        last_id = rows[-1].id
+        elapsed = time.perf_counter() - started
+        print(f"✅ Moved {moved} images ({moved / elapsed:.1f} images/s)")
+
+    print(f"Done: {moved} images moved to {image_store.root}")
+    if moved and not keep_base64:
+        print("   รัน VACUUM product_image_vectors เพื่อคืนพื้นที่ของ column image")
+    return moved
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Move base64 product images into the content-addressed image store"
+    )
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument(
+        "--keep-base64",
+        action="store_true",
+        help="fill image_key but leave the old image column untouched",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        await migrate(args.batch_size, args.keep_base64)
+    finally:
+        await engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
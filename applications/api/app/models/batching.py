@@ -0,0 +1,121 @@
+import time
+import asyncio
+import torch
+from .. import metrics
+
+BATCH_SIZE = metrics.registry.histogram(
+    "inference_batch_size",
+    "Images per batched forward pass",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+FORWARD_SECONDS = metrics.registry.histogram(
+    "inference_forward_seconds", "Time of one batched forward pass", ["model"]
+)
+
+
+class MicroBatcher:
+    """Collects concurrent single-image requests into one batched forward pass.
+
+    A batch is sent to ``infer_fn`` as soon as it holds ``max_batch_size``
+    inputs or the first input has waited ``max_wait_ms``. Every caller gets
+    back its own row of the output.
+
+    ``name`` labels the batch metrics and prefixes the per-request stage
+    timings when more than one model is served (e.g. ``small_forward``).
+    """
+
+    def __init__(
+        self, infer_fn, max_batch_size=16, max_wait_ms=2.0, executor=None, name=None
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.infer_fn = infer_fn
+        self.name = name
+        self._prefix = f"{name}_" if name else ""
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = None
+        self._worker = None
+
+    @property
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+        self._worker = None
+
+    async def submit(self, tensor):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self._queue.put((tensor, future))
+        row, forward = await future
+        metrics.record(
+            self._prefix + "batch_wait", time.perf_counter() - start - forward
+        )
+        metrics.record(self._prefix + "forward", forward)
+        return row
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # เอาของที่รออยู่ในคิวแล้วก่อน ไม่ต้องเสียเวลารอ
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            batch = [(tensor, future) for tensor, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            try:
+                inputs = torch.stack([tensor for tensor, _ in batch])
+                start = time.perf_counter()
+                outputs = await loop.run_in_executor(
+                    self.executor, self.infer_fn, inputs
+                )
+                forward = time.perf_counter() - start
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            model = self.name or "full"
+            BATCH_SIZE.observe(len(batch), model=model)
+            FORWARD_SECONDS.observe(forward, model=model)
+            for (_, future), row in zip(batch, outputs):
+                if not future.done():
+                    future.set_result((row, forward))
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """In-process LRU cache of embeddings keyed by a hash of the image bytes.
+
+    Bounded both by entry count and by total embedding bytes. Concurrent
+    requests for the same image share one computation (single-flight).
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def key(image_bytes: bytes) -> str:
+        return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _store(self, key, value):
+        size = value.nbytes
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key).nbytes
+        self._entries[key] = value
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    async def get_or_compute(self, image_bytes: bytes, compute):
+        if not self.enabled:
+            return await compute(image_bytes)
+
+        key = self.key(image_bytes)
+        while True:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            future = self._inflight.get(key)
+            if future is None:
+                break
+
+            # มี request ภาพเดียวกันกำลังคำนวณอยู่ รอผลจากตัวนั้นแทน
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # ตัวที่คำนวณอยู่ถูกยกเลิก วนกลับไปคำนวณเอง
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute(image_bytes)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # กัน warning "exception was never retrieved" เมื่อไม่มีใครรอ
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        value.setflags(write=False)
+        self._store(key, value)
+        future.set_result(value)
+        return value
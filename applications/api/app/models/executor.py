@@ -0,0 +1,57 @@
+import os
+import asyncio
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class ExecutorBusyError(Exception):
+    pass
+
+
+class InferenceExecutor:
+    """Runs CPU-bound work (decode, preprocess) off the event loop.
+
+    ``kind`` selects a thread or process pool. At most ``max_pending``
+    requests may hold a slot at once; further requests are rejected with
+    ``ExecutorBusyError`` instead of queueing without bound.
+    """
+
+    def __init__(self, kind="thread", workers=None, max_pending=64):
+        workers = workers or min(4, os.cpu_count() or 1)
+        if kind == "thread":
+            self._pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="inference"
+            )
+        elif kind == "process":
+            # ใช้ spawn เพราะ fork หลังจาก torch สร้าง thread แล้วอาจ deadlock ได้
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    @contextmanager
+    def slot(self):
+        if self.max_pending and self._pending >= self.max_pending:
+            raise ExecutorBusyError("Inference queue is full")
+        self._pending += 1
+        try:
+            yield
+        finally:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, fn, *args)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,76 @@
+import sys
+import argparse
+import torch
+from .utils import CONFIG
+from .parity import check_parity, TEST_IMAGES_DIR
+from .runtime import EAGER_PATH, TORCHSCRIPT_PATH, ONNX_PATH, load_eager_model
+
+
+def export_torchscript(model, path, example):
+    traced = torch.jit.trace(model, example)
+    # freeze รวม weight เข้ากับ graph และตัด dropout/branch ที่ไม่ใช้ตอน inference
+    frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    frozen.save(path)
+    print(f"✅ Saved TorchScript model: {path}")
+
+
+def export_onnx(model, path, example, opset=17):
+    torch.onnx.export(
+        model,
+        example,
+        path,
+        input_names=["input"],
+        output_names=["embedding"],
+        dynamic_axes={"input": {0: "batch"}, "embedding": {0: "batch"}},
+        opset_version=opset,
+        dynamo=False,
+    )
+    print(f"✅ Saved ONNX model: {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export deep_search_shoe_model.pth to TorchScript and ONNX"
+    )
+    parser.add_argument("--weights", default=EAGER_PATH)
+    parser.add_argument("--torchscript", default=TORCHSCRIPT_PATH)
+    parser.add_argument("--onnx", default=ONNX_PATH)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--images", default=TEST_IMAGES_DIR)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--skip-parity", action="store_true")
+    args = parser.parse_args(argv)
+
+    model = load_eager_model(args.weights)
+    example = torch.randn(2, 3, *CONFIG["IMAGE_SIZE"])
+
+    export_torchscript(model, args.torchscript, example)
+    export_onnx(model, args.onnx, example, args.opset)
+
+    if args.skip_parity:
+        return 0
+
+    backends = ["torchscript"]
+    try:
+        import onnxruntime  # noqa: F401
+
+        backends.append("onnx")
+    except ImportError:
+        print("⚠️ onnxruntime is not installed, skipping ONNX parity check")
+
+    try:
+        check_parity(
+            backends,
+            args.images,
+            args.tolerance,
+            weights=args.weights,
+            paths={"torchscript": args.torchscript, "onnx": args.onnx},
+        )
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import torch
+from torchvision import transforms
+from .utils import load_image, image_to_tensor
+from .runtime import RUNTIMES, load_runtime, available_cores
+from .parity import REPO_ROOT, list_images
+
+DATASET_DIRS = [
+    os.path.join(REPO_ROOT, "data", "dataset", "Test"),
+    os.path.join(REPO_ROOT, "data", "dataset", "Raw"),
+]
+BASELINE_PATH = os.path.join(
+    os.path.dirname(__file__), "../../benchmark-results/microbench-baseline.json"
+)
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+class PeakMemory:
+    """Peak memory growth over the block, in bytes.
+
+    On CUDA this is the allocator's peak; on CPU a thread samples the
+    resident set size, which also covers PIL and torch buffers that
+    ``tracemalloc`` cannot see. ``None`` where RSS is unavailable.
+    """
+
+    def __init__(self, device, interval=0.0005):
+        self.device = device
+        self.interval = interval
+        self.peak = None
+
+    def __enter__(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            self._start = torch.cuda.memory_allocated()
+            return self
+        self._start = _rss()
+        self._max = self._start
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        if self._start is not None:
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self._max = max(self._max, _rss())
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize()
+            self.peak = torch.cuda.max_memory_allocated() - self._start
+            return
+        if self._start is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._max = max(self._max, _rss())
+        self.peak = self._max - self._start
+
+
+def _preprocess_for(resolution):
+    # เหมือน utils.preprocess แต่เปลี่ยนขนาด Resize ได้
+    return transforms.Compose(
+        [
+            transforms.Resize((resolution, resolution)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ]
+    )
+
+
+def _timings(samples, items):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "ms_per_image": total / items * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "min_ms": samples[0] * 1000,
+    }
+
+
+def bench_decode(blobs, device):
+    """``Image.open(...).convert("RGB")`` for every image, from bytes in memory."""
+    samples = []
+    with PeakMemory(device) as memory:
+        for blob in blobs:
+            start = time.perf_counter()
+            load_image(blob)
+            samples.append(time.perf_counter() - start)
+    return {**_timings(samples, len(blobs)), "peak_bytes": memory.peak}
+
+
+def bench_fast(blobs, device):
+    """The API's fused path: reduced-scale decode straight into the tensor."""
+    samples = []
+    with PeakMemory(device) as memory:
+        for blob in blobs:
+            start = time.perf_counter()
+            image_to_tensor(blob)
+            samples.append(time.perf_counter() - start)
+    return {**_timings(samples, len(blobs)), "peak_bytes": memory.peak}
+
+
+def bench_preprocess(images, resolution, device):
+    preprocess = _preprocess_for(resolution)
+    samples = []
+    with PeakMemory(device) as memory:
+        for image in images:
+            start = time.perf_counter()
+            preprocess(image)
+            samples.append(time.perf_counter() - start)
+    return {**_timings(samples, len(images)), "peak_bytes": memory.peak}
+
+
+def bench_forward(runtime, tensors, batch_size, device, warmup=2, repeats=5):
+    # ใช้ภาพจริงวนซ้ำจนเต็ม batch; วัดเฉพาะ forward ไม่รวมการ stack
+    batch = torch.stack([tensors[i % len(tensors)] for i in range(batch_size)])
+    for _ in range(warmup):
+        runtime(batch)
+    samples = []
+    with PeakMemory(device) as memory:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            runtime(batch)
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            samples.append(time.perf_counter() - start)
+    timings = _timings(samples, batch_size * repeats)
+    timings["images_per_s"] = 1000 / timings["ms_per_image"]
+    return {**timings, "peak_bytes": memory.peak}
+
+
+def run(
+    paths,
+    runtime_name="eager",
+    weights=None,
+    batch_sizes=(1, 8, 32),
+    threads=(1,),
+    resolutions=(224,),
+    repeats=5,
+):
+    """Time decode, preprocess and forward separately over ``paths``.
+
+    Decode does not depend on the sweep and runs once; preprocess runs per
+    (resolution, threads) and forward per (resolution, threads, batch size).
+    Returns a list of result rows.
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    runtime = load_runtime(runtime_name, path=weights, device=device)
+    blobs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            blobs.append(f.read())
+
+    rows = [
+        {"stage": "decode", **bench_decode(blobs, device)},
+        {"stage": "fast_decode_preprocess", **bench_fast(blobs, device)},
+    ]
+    images = [load_image(blob) for blob in blobs]
+    for resolution in resolutions:
+        tensors = [_preprocess_for(resolution)(image) for image in images]
+        for n in threads:
+            torch.set_num_threads(n)
+            params = {"resolution": resolution, "threads": n}
+            rows.append(
+                {
+                    "stage": "preprocess",
+                    **params,
+                    **bench_preprocess(images, resolution, device),
+                }
+            )
+            for batch_size in batch_sizes:
+                rows.append(
+                    {
+                        "stage": "forward",
+                        **params,
+                        "batch_size": batch_size,
+                        **bench_forward(
+                            runtime, tensors, batch_size, device, repeats=repeats
+                        ),
+                    }
+                )
+    return rows
+
+
+def row_key(row):
+    return "/".join(
+        f"{name}={row[name]}"
+        for name in ("stage", "resolution", "threads", "batch_size")
+        if name in row
+    )
+
+
+def compare(rows, baseline, tolerance=0.1):
+    """Per-row time ratio against ``baseline`` rows; ``regressed`` when slower
+    than ``1 + tolerance``. Rows missing from the baseline are skipped."""
+    previous = {row_key(row): row for row in baseline}
+    changes = []
+    for row in rows:
+        before = previous.get(row_key(row))
+        if before is None:
+            continue
+        ratio = row["ms_per_image"] / before["ms_per_image"]
+        changes.append(
+            {"key": row_key(row), "ratio": ratio, "regressed": ratio > 1 + tolerance}
+        )
+    return changes
+
+
+def _ints(text):
+    return [int(value) for value in text.split(",")]
+
+
+def _mb(value):
+    return f"{value / 2**20:.1f}" if value is not None else "-"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time decode, preprocess and forward pass of the embedding model"
+    )
+    parser.add_argument("--images", nargs="+", default=DATASET_DIRS)
+    parser.add_argument("--limit", type=int, default=64, help="images to use (0: all)")
+    parser.add_argument("--runtime", choices=sorted(RUNTIMES), default="eager")
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--batch-sizes", type=_ints, default=[1, 8, 32])
+    parser.add_argument("--threads", type=_ints, default=[1, available_cores()])
+    parser.add_argument("--resolutions", type=_ints, default=[160, 224, 288])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="overwrite the baseline with this run instead of comparing",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--report", help="also write this run as JSON to this path")
+    args = parser.parse_args(argv)
+
+    paths = [path for root in args.images for path in list_images(root)]
+    if args.limit:
+        paths = paths[: args.limit]
+    if not paths:
+        print(f"❌ No images found in {', '.join(args.images)}")
+        return 1
+
+    threads = sorted(set(args.threads))
+    rows = run(
+        paths,
+        args.runtime,
+        args.weights,
+        args.batch_sizes,
+        threads,
+        args.resolutions,
+        args.repeats,
+    )
+
+    print(f"{len(paths)} images, runtime={args.runtime}")
+    print(f"{'stage':<52} {'ms/image':>9} {'p50 ms':>9} {'peak MB':>8}")
+    for row in rows:
+        print(
+            f"{row_key(row):<52} {row['ms_per_image']:>9.3f}"
+            f" {row['p50_ms']:>9.3f} {_mb(row['peak_bytes']):>8}"
+        )
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runtime": args.runtime,
+        "images": len(paths),
+        "host": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cores": available_cores(),
+        },
+        "results": rows,
+    }
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(result, f, indent=2)
+
+    baseline_path = os.path.abspath(args.baseline)
+    if args.save_baseline or not os.path.exists(baseline_path):
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    changes = compare(rows, baseline["results"], args.tolerance)
+    print(f"Compared with baseline from {baseline['timestamp']}:")
+    for change in changes:
+        flag = "❌" if change["regressed"] else "  "
+        print(f"{flag} {change['key']:<52} {change['ratio']:>6.2f}x")
+    regressed = [change for change in changes if change["regressed"]]
+    if regressed:
+        print(f"❌ {len(regressed)} stages are more than {args.tolerance:.0%} slower")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,39 @@
 import torchvision
 import torch.nn as nn
 import torch.nn.functional as F
-from torchvision.models import ResNet18_Weights
+from torchvision.models import ResNet18_Weights, MobileNet_V3_Small_Weights
+
+# backbone ที่รองรับ: (constructor, ImageNet weights, ชื่อ layer หัวที่จะถูกแทนด้วย Identity)
+BACKBONES = {
+    "resnet18": (torchvision.models.resnet18, ResNet18_Weights.DEFAULT, "fc"),
+    # model เล็กสำหรับ cascade: เร็วกว่า resnet18 หลายเท่าบน CPU
+    "mobilenet_v3_small": (
+        torchvision.models.mobilenet_v3_small,
+        MobileNet_V3_Small_Weights.DEFAULT,
+        "classifier",
+    ),
+}
+
+
+def _head_in_features(head):
+    if isinstance(head, nn.Linear):
+        return head.in_features
+    return next(m for m in head.modules() if isinstance(m, nn.Linear)).in_features
 
 
 class DeepSearchShoeModel(nn.Module):
-    def __init__(self, embedding_size=128):
+    def __init__(self, embedding_size=128, pretrained=True, backbone="resnet18"):
         super(DeepSearchShoeModel, self).__init__()
-        self.backbone = torchvision.models.resnet18(weights=ResNet18_Weights.DEFAULT)
-        in_dim = self.backbone.fc.in_features
-        self.backbone.fc = nn.Identity()
+        if backbone not in BACKBONES:
+            raise ValueError(
+                f"Unknown backbone: {backbone} (expected one of {', '.join(BACKBONES)})"
+            )
+        build, default_weights, head = BACKBONES[backbone]
+        # pretrained=False ตอนโหลด checkpoint ที่ train แล้ว ไม่ต้องโหลด ImageNet weights จาก network
+        weights = default_weights if pretrained else None
+        self.backbone = build(weights=weights)
+        in_dim = _head_in_features(getattr(self.backbone, head))
+        setattr(self.backbone, head, nn.Identity())
         self.fc = nn.Linear(in_dim, embedding_size)
         self.dropout = nn.Dropout(0.3)
 
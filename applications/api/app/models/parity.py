@@ -0,0 +1,120 @@
+import os
+import sys
+import argparse
+import torch
+from .utils import images_to_batch, load_image, preprocess
+from .runtime import RUNTIMES, EagerRuntime, load_runtime
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../.."))
+TEST_IMAGES_DIR = os.path.join(REPO_ROOT, "data", "system", "test")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def list_images(root):
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+def embed_paths(runtime, paths, batch_size=16):
+    outputs = []
+    for start in range(0, len(paths), batch_size):
+        chunk = paths[start : start + batch_size]
+        outputs.append(runtime(images_to_batch(chunk)))
+    return torch.cat(outputs)
+
+
+def check_parity(
+    backends, images_dir=TEST_IMAGES_DIR, tolerance=1e-3, weights=None, paths=None
+):
+    """Compare each backend against eager PyTorch on every image in ``images_dir``.
+
+    Returns ``{backend: max_abs_diff}`` and raises ``AssertionError`` if any
+    backend is off by more than ``tolerance``.
+    """
+    paths = paths or {}
+    images = list_images(images_dir)
+    if not images:
+        raise FileNotFoundError(f"No images found in {images_dir}")
+
+    expected = embed_paths(EagerRuntime(weights), images)
+
+    results = {}
+    for name in backends:
+        runtime = load_runtime(name, path=paths.get(name))
+        actual = embed_paths(runtime, images)
+        results[name] = (actual - expected).abs().max().item()
+        print(f"{name:<12} max |diff| = {results[name]:.2e} over {len(images)} images")
+
+    failed = {name: diff for name, diff in results.items() if diff > tolerance}
+    if failed:
+        raise AssertionError(
+            f"Embedding parity failed (tolerance {tolerance}): "
+            + ", ".join(f"{name}={diff:.2e}" for name, diff in failed.items())
+        )
+    return results
+
+
+def check_preprocess(images_dir=TEST_IMAGES_DIR, tolerance=5e-3, weights=None):
+    """Compare the fast decode path against the reference torchvision pipeline.
+
+    Reduced-scale JPEG decoding changes individual pixels slightly, so the
+    check is on the eager embeddings: returns their max abs difference and
+    raises ``AssertionError`` above ``tolerance``.
+    """
+    images = list_images(images_dir)
+    if not images:
+        raise FileNotFoundError(f"No images found in {images_dir}")
+
+    runtime = EagerRuntime(weights)
+    fast = embed_paths(runtime, images)
+    reference = torch.cat(
+        [
+            runtime(torch.stack([preprocess(load_image(path)) for path in chunk]))
+            for chunk in (images[i : i + 16] for i in range(0, len(images), 16))
+        ]
+    )
+    diff = (fast - reference).abs().max().item()
+    print(f"{'preprocess':<12} max |diff| = {diff:.2e} over {len(images)} images")
+    if diff > tolerance:
+        raise AssertionError(
+            f"Fast preprocessing differs from torchvision (tolerance {tolerance}): {diff:.2e}"
+        )
+    return diff
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check exported runtimes against eager PyTorch embeddings"
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=[name for name in RUNTIMES if name != "eager"],
+        choices=list(RUNTIMES),
+    )
+    parser.add_argument("--images", default=TEST_IMAGES_DIR)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument(
+        "--preprocess-tolerance",
+        type=float,
+        default=5e-3,
+        help="allowed embedding difference of the fast decode path",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        check_preprocess(args.images, args.preprocess_tolerance)
+        check_parity(args.backends, args.images, args.tolerance)
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+    print("✅ Fast preprocessing and all backends match eager PyTorch")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
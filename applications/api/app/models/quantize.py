@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import copy
+import argparse
+import tempfile
+import torch
+import torch.nn.functional as F
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from .utils import CONFIG, images_to_batch
+from .parity import REPO_ROOT, list_images, embed_paths
+from .runtime import MODELS_DIR, EAGER_PATH, EagerRuntime, TorchScriptRuntime
+
+DATASET_DIR = os.path.join(REPO_ROOT, "data", "dataset")
+INT8_PATH = os.path.join(MODELS_DIR, "deep_search_shoe_model.int8.pt")
+
+
+def calibrate_and_convert(model, calibration_paths, batch_size=16, backend="x86"):
+    torch.backends.quantized.engine = backend
+    example = torch.randn(1, 3, *CONFIG["IMAGE_SIZE"])
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    prepared = prepare_fx(copy.deepcopy(model), qconfig_mapping, (example,))
+
+    with torch.no_grad():
+        for start in range(0, len(calibration_paths), batch_size):
+            chunk = calibration_paths[start : start + batch_size]
+            prepared(images_to_batch(chunk))
+
+    quantized = convert_fx(prepared)
+    traced = torch.jit.trace(quantized, example)
+    return torch.jit.freeze(traced)
+
+
+def retrieval_accuracy(embeddings, labels, ks=(1, 5)):
+    """Leave-one-out product retrieval: each image queries all the others.
+
+    A hit at k means the query's product is among the first k distinct
+    products ranked by cosine similarity.
+    """
+    similarity = embeddings @ embeddings.T
+    similarity.fill_diagonal_(-float("inf"))
+    order = similarity.argsort(dim=1, descending=True)
+
+    hits = {k: 0 for k in ks}
+    for i, ranked in enumerate(order.tolist()):
+        products = []
+        for j in ranked[:-1]:
+            if labels[j] not in products:
+                products.append(labels[j])
+            if len(products) >= max(ks):
+                break
+        for k in ks:
+            if labels[i] in products[:k]:
+                hits[k] += 1
+    return {f"top{k}": hits[k] / len(labels) for k in ks}
+
+
+def measure_latency(runtime, batch_size, repeats=20):
+    batch = torch.randn(batch_size, 3, *CONFIG["IMAGE_SIZE"])
+    runtime(batch)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        runtime(batch)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def evaluate(runtimes, splits, batch_sizes=(1, 16)):
+    report = {"splits": {}, "latency_ms": {}}
+    for split, root in splits.items():
+        paths = list_images(root)
+        labels = [os.path.basename(os.path.dirname(path)) for path in paths]
+        report["splits"][split] = {"images": len(paths)}
+        for name, runtime in runtimes.items():
+            embeddings = F.normalize(embed_paths(runtime, paths), dim=1)
+            report["splits"][split][name] = retrieval_accuracy(embeddings, labels)
+
+    for name, runtime in runtimes.items():
+        report["latency_ms"][name] = {
+            f"batch{size}": measure_latency(runtime, size) for size in batch_sizes
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Int8 post-training quantization of DeepSearchShoeModel"
+    )
+    parser.add_argument("--weights", default=EAGER_PATH)
+    parser.add_argument("--output", default=INT8_PATH)
+    parser.add_argument("--calibration", default=os.path.join(DATASET_DIR, "Valid"))
+    parser.add_argument(
+        "--eval-splits",
+        nargs="+",
+        default=[
+            os.path.join(DATASET_DIR, "Test"),
+            os.path.join(DATASET_DIR, "Unseen"),
+        ],
+    )
+    parser.add_argument(
+        "--max-accuracy-drop",
+        type=float,
+        default=0.01,
+        help="largest allowed drop in top-1/top-5 accuracy (0.01 = 1 point)",
+    )
+    parser.add_argument(
+        "--backend", default="x86", choices=["x86", "fbgemm", "qnnpack"]
+    )
+    parser.add_argument(
+        "--report", help="write the evaluation report to this JSON file"
+    )
+    args = parser.parse_args(argv)
+
+    fp32 = EagerRuntime(args.weights)
+    calibration_paths = list_images(args.calibration)
+    if not calibration_paths:
+        print(f"❌ No calibration images found in {args.calibration}")
+        return 1
+
+    print(f"Calibrating on {len(calibration_paths)} images from {args.calibration}")
+    int8_model = calibrate_and_convert(
+        fp32.model, calibration_paths, backend=args.backend
+    )
+
+    # บันทึกลงไฟล์ชั่วคราวก่อน ถ้าไม่ผ่านเกณฑ์จะไม่ไปทับไฟล์จริง
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    fd, candidate_path = tempfile.mkstemp(suffix=".pt", dir=output_dir)
+    os.close(fd)
+    try:
+        int8_model.save(candidate_path)
+        int8 = TorchScriptRuntime(candidate_path)
+
+        splits = {os.path.basename(os.path.normpath(s)): s for s in args.eval_splits}
+        report = evaluate({"fp32": fp32, "int8": int8}, splits)
+        report["size_mb"] = {
+            "fp32": os.path.getsize(args.weights) / 2**20,
+            "int8": os.path.getsize(candidate_path) / 2**20,
+        }
+
+        drops = {}
+        for split, result in report["splits"].items():
+            for metric in result["fp32"]:
+                drops[f"{split}/{metric}"] = (
+                    result["fp32"][metric] - result["int8"][metric]
+                )
+        report["accuracy_drop"] = drops
+        report["max_accuracy_drop"] = args.max_accuracy_drop
+        report["accepted"] = all(d <= args.max_accuracy_drop for d in drops.values())
+
+        print(json.dumps(report, indent=2))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+
+        if not report["accepted"]:
+            print(
+                f"❌ Rejected: accuracy dropped more than {args.max_accuracy_drop} "
+                f"({', '.join(f'{k}={v:.3f}' for k, v in drops.items())})"
+            )
+            return 1
+
+        os.replace(candidate_path, args.output)
+        print(f"✅ Saved int8 model: {args.output}")
+        print(
+            "   ใช้งานใน API ด้วย MODEL_RUNTIME=torchscript MODEL_PATH=" + args.output
+        )
+        return 0
+    finally:
+        if os.path.exists(candidate_path):
+            os.remove(candidate_path)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
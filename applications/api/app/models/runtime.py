@@ -0,0 +1,122 @@
+import os
+import torch
+from .model import DeepSearchShoeModel
+
+MODELS_DIR = os.path.dirname(__file__)
+EAGER_PATH = os.path.join(MODELS_DIR, "deep_search_shoe_model.pth")
+TORCHSCRIPT_PATH = os.path.join(MODELS_DIR, "deep_search_shoe_model.torchscript.pt")
+ONNX_PATH = os.path.join(MODELS_DIR, "deep_search_shoe_model.onnx")
+
+
+def available_cores():
+    # นับเฉพาะ core ที่ process นี้ใช้ได้จริง (taskset/cpuset ของ container)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def threads_per_worker(workers=1):
+    """Intra-op threads for one of ``workers`` processes sharing this node."""
+    return max(1, available_cores() // max(1, workers))
+
+
+def load_eager_model(
+    path=EAGER_PATH, device="cpu", embedding_size=128, backbone="resnet18"
+):
+    """Load the checkpoint memory-mapped, so its weights live in the page cache.
+
+    Every worker process maps the same file read-only instead of holding a
+    private copy. The module is built on the meta device and the mapped
+    tensors are assigned in place, so no throwaway weights are allocated.
+    """
+    with torch.device("meta"):
+        model = DeepSearchShoeModel(
+            embedding_size=embedding_size, pretrained=False, backbone=backbone
+        )
+    try:
+        state_dict = torch.load(path, map_location=device, mmap=True, weights_only=True)
+    except RuntimeError:
+        # checkpoint แบบเก่า (ไม่ใช่ zip) ใช้ mmap ไม่ได้
+        state_dict = torch.load(path, map_location=device, weights_only=True)
+    model.load_state_dict(state_dict, assign=True)
+    model.to(device)
+    model.eval()
+    return model
+
+
+class EagerRuntime:
+    name = "eager"
+    default_path = EAGER_PATH
+
+    def __init__(self, path=None, device="cpu", backbone="resnet18"):
+        self.path = path or self.default_path
+        self.device = torch.device(device)
+        self.model = load_eager_model(self.path, self.device, backbone=backbone)
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch.to(self.device)).cpu()
+
+
+class TorchScriptRuntime:
+    name = "torchscript"
+    default_path = TORCHSCRIPT_PATH
+
+    def __init__(self, path=None, device="cpu"):
+        self.path = path or self.default_path
+        self.device = torch.device(device)
+        self.model = torch.jit.load(self.path, map_location=self.device)
+        self.model.eval()
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch.to(self.device)).cpu()
+
+
+class OnnxRuntime:
+    name = "onnx"
+    default_path = ONNX_PATH
+
+    def __init__(self, path=None, device="cpu"):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "MODEL_RUNTIME=onnx ต้องติดตั้ง onnxruntime ก่อน (pip install onnxruntime)"
+            ) from e
+
+        self.path = path or self.default_path
+        providers = ["CPUExecutionProvider"]
+        if str(device).startswith("cuda"):
+            providers.insert(0, "CUDAExecutionProvider")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # ใช้จำนวน thread เดียวกับ torch ที่ตั้งไว้ต่อ worker
+        options.intra_op_num_threads = torch.get_num_threads()
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            self.path, sess_options=options, providers=providers
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        inputs = batch.detach().cpu().numpy()
+        (output,) = self.session.run(None, {self.input_name: inputs})
+        return torch.from_numpy(output)
+
+
+RUNTIMES = {
+    runtime.name: runtime for runtime in (EagerRuntime, TorchScriptRuntime, OnnxRuntime)
+}
+
+
+def load_runtime(name="eager", path=None, device="cpu", backbone="resnet18"):
+    if name not in RUNTIMES:
+        raise ValueError(
+            f"Unknown model runtime: {name} (expected one of {', '.join(RUNTIMES)})"
+        )
+    if name == "eager":
+        return EagerRuntime(path=path, device=device, backbone=backbone)
+    # ไฟล์ TorchScript/ONNX มีโครงสร้าง model อยู่ในตัวแล้ว ไม่ต้องรู้ backbone
+    return RUNTIMES[name](path=path, device=device)
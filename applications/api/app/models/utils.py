@@ -1,33 +1,102 @@
+import time
+import numpy as np
 import torch
 from PIL import Image
 from io import BytesIO
 from torchvision import transforms
 
 CONFIG = {"IMAGE_SIZE": (224, 224)}
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+# JPEG ถูก decode ลดขนาดด้วย DCT scaling แต่ไม่ให้เล็กกว่า DRAFT_FACTOR เท่าของขนาดเป้าหมาย
+DRAFT_FACTOR = 2
 
+# pipeline อ้างอิง (torchvision) ใช้ตรวจว่า fast path ให้ผลตรงกัน
 preprocess = transforms.Compose(
     [
         transforms.Resize(CONFIG["IMAGE_SIZE"]),
         transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        transforms.Normalize(mean=MEAN, std=STD),
     ]
 )
 
-def get_image_embedding(model, image_input, device):
+# (x / 255 - mean) / std == x * scale - shift
+_SCALE = np.array([1 / (255 * s) for s in STD], dtype=np.float32).reshape(3, 1, 1)
+_SHIFT = np.array([m / s for m, s in zip(MEAN, STD)], dtype=np.float32).reshape(3, 1, 1)
+
 
+def open_image(image_input):
     if isinstance(image_input, bytes):
-        img = Image.open(BytesIO(image_input)).convert("RGB")
+        return Image.open(BytesIO(image_input))
     elif isinstance(image_input, str):
-        img = Image.open(image_input).convert("RGB")
+        return Image.open(image_input)
     else:
         raise ValueError("image_input ต้องเป็น str (path) หรือ bytes")
 
-    input_tensor = preprocess(img).unsqueeze(0).to(device)
 
+def load_image(image_input):
+    return open_image(image_input).convert("RGB")
+
+
+def load_resized(image_input, size=CONFIG["IMAGE_SIZE"]):
+    """Decode straight to an RGB image of ``size`` (height, width).
+
+    JPEGs are decoded at a reduced scale when they are much larger than
+    ``size``; other formats are decoded in full. Resizing is the same
+    bilinear filter torchvision's ``Resize`` uses on PIL images.
+    """
+    height, width = size
+    image = open_image(image_input)
+    image.draft("RGB", (width * DRAFT_FACTOR, height * DRAFT_FACTOR))
+    return image.convert("RGB").resize((width, height), Image.BILINEAR)
+
+
+def pixels_to_tensor(image, out=None):
+    """Normalise an RGB image of ``CONFIG["IMAGE_SIZE"]`` into a (3, H, W)
+    float tensor, writing into ``out`` (e.g. a row of a batch) when given.
+
+    The uint8 pixels are converted and normalised in place, with no
+    intermediate tensors.
+    """
+    if out is None:
+        out = torch.empty((3,) + CONFIG["IMAGE_SIZE"])
+    target = out.numpy()
+    np.multiply(np.asarray(image).transpose(2, 0, 1), _SCALE, out=target)
+    np.subtract(target, _SHIFT, out=target)
+    return out
+
+
+def image_to_tensor(image_input, out=None):
+    # Decode + preprocess หนึ่งภาพ ได้ tensor ขนาด (3, H, W) ที่พร้อมนำไป stack เป็น batch
+    return pixels_to_tensor(load_resized(image_input), out)
+
+
+def images_to_batch(image_inputs):
+    # decode ทุกภาพลงใน batch tensor ที่จองไว้ครั้งเดียว ไม่ต้อง torch.stack
+    batch = torch.empty((len(image_inputs), 3) + CONFIG["IMAGE_SIZE"])
+    for row, image_input in zip(batch, image_inputs):
+        image_to_tensor(image_input, out=row)
+    return batch
+
+
+def timed_image_to_tensor(image_input):
+    # เหมือน image_to_tensor แต่คืนเวลา decode/preprocess (วินาที) มาด้วย ใช้วัด latency แต่ละขั้น
+    start = time.perf_counter()
+    image = load_resized(image_input)
+    decoded = time.perf_counter()
+    tensor = pixels_to_tensor(image)
+    return tensor, decoded - start, time.perf_counter() - decoded
+
+
+def get_batch_embedding(model, batch, device):
     with torch.no_grad():
-        embedding = model(input_tensor)
+        return model(batch.to(device))
+
+
+def get_image_embedding(model, image_input, device):
+    input_tensor = image_to_tensor(image_input).unsqueeze(0)
+    return get_batch_embedding(model, input_tensor, device)
 
-    return embedding
 
 def cosine_distance_to_percent(distance: float) -> float:
-    return max(0, min(100, (1 - distance / 2) * 100))
\ No newline at end of file
+    return max(0, min(100, (1 - distance / 2) * 100))
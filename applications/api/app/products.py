@@ -4,7 +4,7 @@ from pydantic import BaseModel, Field
 from pgvector.sqlalchemy import Vector
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import Column, String, Integer, Numeric, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Numeric, Text, DateTime, ForeignKey, Index
 from typing import List, Optional
 
 Base = declarative_base()
@@ -56,8 +56,61 @@ class ProductVector(Base):
     )
     embeded = Column(Vector(128), nullable=False)
     image = Column(Text)
+    image_key = Column(String(80), index=True)
+    model_version = Column(String(64), nullable=False, server_default="v1")
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index(
+            "product_image_vectors_embeded_hnsw_idx",
+            "embeded",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embeded": "vector_cosine_ops"},
+        ),
+        Index("product_image_vectors_product_code_idx", "product_code"),
+        Index("product_image_vectors_model_version_idx", "model_version", "id"),
+    )
+
+
+class CascadeVector(Base):
+    # vector ของ model เล็ก (cascade) แยกตาราง/HNSW graph จาก model เต็ม
+    # คนละ embedding space กัน จึงไม่ควรอยู่ใน index เดียวกัน
+    __tablename__ = "cascade_image_vectors"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    product_code = Column(
+        String(50), ForeignKey("products.product_code"), nullable=False
+    )
+    embeded = Column(Vector(128), nullable=False)
+    image_key = Column(String(80))
+    model_version = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index(
+            "cascade_image_vectors_embeded_hnsw_idx",
+            "embeded",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embeded": "vector_cosine_ops"},
+        ),
+        Index("cascade_image_vectors_product_code_idx", "product_code", "image_key"),
+        Index("cascade_image_vectors_model_version_idx", "model_version", "id"),
+    )
+
+
+class EmbeddingVersion(Base):
+    __tablename__ = "embedding_versions"
+
+    version = Column(String(64), primary_key=True)
+    source_version = Column(String(64))
+    status = Column(String(20), nullable=False, default="building")
+    checkpoint = Column(UUID(as_uuid=True))
+    processed = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 class LowStockProduct(BaseModel):
     product_code: str
     product_name: str
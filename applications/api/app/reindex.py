@@ -0,0 +1,295 @@
+import sys
+import time
+import asyncio
+import argparse
+import torch
+from sqlalchemy import select, insert, update, delete, func, exists
+from sqlalchemy.orm import aliased
+from .database import AsyncSessionLocal, engine
+from .products import CascadeVector, ProductVector, EmbeddingVersion
+from .storage import image_store
+from .models.utils import CONFIG, image_to_tensor
+from .models.model import BACKBONES
+from .models.runtime import RUNTIMES, load_runtime
+from .versions import MODEL_VERSION
+
+
+def _embed_keys(runtime, keys):
+    # อ่านภาพจาก image store แล้ว embed เป็น batch เดียว; ภาพที่หาไม่เจอคืน None
+    batch = torch.empty((len(keys), 3) + CONFIG["IMAGE_SIZE"])
+    found = []
+    for key in keys:
+        try:
+            image_to_tensor(image_store.read(key), out=batch[len(found)])
+            found.append(key)
+        except (FileNotFoundError, OSError, ValueError):
+            continue
+    if not found:
+        return {}
+    embeddings = runtime(batch[: len(found)]).numpy()
+    return dict(zip(found, embeddings))
+
+
+def _pending_stmt(source, target, checkpoint, skipped, batch_size, table):
+    copy = aliased(table)
+    stmt = (
+        select(ProductVector.id, ProductVector.product_code, ProductVector.image_key)
+        .where(
+            ProductVector.model_version == source,
+            ProductVector.image_key.is_not(None),
+            ~exists().where(
+                copy.model_version == target,
+                copy.product_code == ProductVector.product_code,
+                copy.image_key == ProductVector.image_key,
+            ),
+        )
+        .order_by(ProductVector.id)
+        .limit(batch_size)
+    )
+    if checkpoint is not None:
+        stmt = stmt.where(ProductVector.id > checkpoint)
+    if skipped:
+        stmt = stmt.where(ProductVector.id.not_in(skipped))
+    return stmt
+
+
+async def _ensure_version(target, source):
+    async with AsyncSessionLocal() as db:
+        version = await db.get(EmbeddingVersion, target)
+        if version is None:
+            version = EmbeddingVersion(
+                version=target, source_version=source, status="building"
+            )
+            db.add(version)
+            await db.commit()
+        return version.status, version.checkpoint, version.processed
+
+
+async def reindex(
+    target,
+    model_path,
+    runtime_name="eager",
+    source=MODEL_VERSION,
+    batch_size=64,
+    max_rate=None,
+    pause_ms=0,
+    backbone="resnet18",
+    table=ProductVector,
+):
+    """Re-embed every ``source`` image with the new model as ``target`` rows
+    of ``table`` (``CascadeVector`` for the cascade's small model).
+
+    Works in small batches, each committed together with its checkpoint, so
+    the job can be stopped and resumed and never holds long locks. The API
+    keeps serving ``source`` until instances switch MODEL_VERSION, and
+    ``/readyz`` on a ``target`` instance stays 503 until this finishes.
+    """
+    if target == source:
+        raise ValueError("target version must differ from the source version")
+
+    async with AsyncSessionLocal() as db:
+        legacy = await db.scalar(
+            select(func.count()).where(
+                ProductVector.model_version == source,
+                ProductVector.image_key.is_(None),
+            )
+        )
+    if legacy:
+        raise RuntimeError(
+            f"{legacy} {source} vectors still keep their image as base64;"
+            " run python -m app.migrate_images first"
+        )
+
+    status, checkpoint, processed = await _ensure_version(target, source)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    runtime = load_runtime(
+        runtime_name, path=model_path, device=device, backbone=backbone
+    )
+
+    skipped = set()
+    done = 0
+    started = time.perf_counter()
+    while True:
+        async with AsyncSessionLocal() as db:
+            rows = (
+                await db.execute(
+                    _pending_stmt(
+                        source, target, checkpoint, skipped, batch_size, table
+                    )
+                )
+            ).all()
+            if not rows:
+                if checkpoint is None:
+                    break
+                # จบหนึ่งรอบแล้ว วนใหม่ตั้งแต่ต้นเพื่อเก็บภาพที่ถูกเพิ่มเข้ามาระหว่างรอบ
+                checkpoint = None
+                await db.execute(
+                    update(EmbeddingVersion)
+                    .where(EmbeddingVersion.version == target)
+                    .values(checkpoint=None)
+                )
+                await db.commit()
+                continue
+
+            embeddings = await asyncio.to_thread(
+                _embed_keys, runtime, [row.image_key for row in rows]
+            )
+            values = []
+            for row in rows:
+                embedding = embeddings.get(row.image_key)
+                if embedding is None:
+                    skipped.add(row.id)
+                    continue
+                values.append(
+                    {
+                        "product_code": row.product_code,
+                        "embeded": embedding.tolist(),
+                        "image_key": row.image_key,
+                        "model_version": target,
+                    }
+                )
+
+            checkpoint = rows[-1].id
+            processed += len(values)
+            if values:
+                await db.execute(insert(table), values)
+            # checkpoint อยู่ใน transaction เดียวกับ vector ที่เพิ่ง insert
+            await db.execute(
+                update(EmbeddingVersion)
+                .where(EmbeddingVersion.version == target)
+                .values(checkpoint=checkpoint, processed=processed)
+            )
+            await db.commit()
+
+        done += len(values)
+        elapsed = time.perf_counter() - started
+        print(f"✅ Re-embedded {done} images ({done / elapsed:.1f} images/s)")
+
+        # throttle ไม่ให้แย่ง CPU/DB กับ production traffic
+        delay = pause_ms / 1000
+        if max_rate:
+            delay = max(delay, done / max_rate - elapsed)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    if skipped:
+        print(f"⚠️  {len(skipped)} images were missing from the image store")
+    if status != "complete":
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(EmbeddingVersion)
+                .where(EmbeddingVersion.version == target)
+                .values(status="complete", checkpoint=None)
+            )
+            await db.commit()
+    print(f"Done: {target} is complete ({processed} vectors)")
+    return done
+
+
+def _has_copy(table, version):
+    copy = aliased(table)
+    return exists().where(
+        copy.model_version == version,
+        copy.product_code == table.product_code,
+        copy.image_key == table.image_key,
+    )
+
+
+async def purge(version, keep, batch_size=1000, table=ProductVector):
+    """Delete ``version`` vectors of ``table`` once ``keep`` is complete and serving.
+
+    Only rows that already have a ``keep`` copy are deleted; images uploaded
+    through ``version`` instances after the re-index finished are kept until
+    a re-index run copies them.
+    """
+    async with AsyncSessionLocal() as db:
+        status = await db.scalar(
+            select(EmbeddingVersion.status).where(EmbeddingVersion.version == keep)
+        )
+    if status != "complete":
+        raise RuntimeError(f"{keep} is not complete yet; refusing to purge {version}")
+
+    removed = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            ids = (
+                select(table.id)
+                .where(table.model_version == version, _has_copy(table, keep))
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = await db.execute(delete(table).where(table.id.in_(ids)))
+            await db.commit()
+        if not result.rowcount:
+            break
+        removed += result.rowcount
+        print(f"✅ Purged {removed} {version} vectors")
+
+    async with AsyncSessionLocal() as db:
+        pending = await db.scalar(
+            select(func.count()).where(table.model_version == version)
+        )
+    if pending:
+        print(
+            f"⚠️  {pending} {version} vectors have no {keep} copy yet and were kept;"
+            f" re-run python -m app.reindex {keep} to copy them, then purge again"
+        )
+    return removed
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-embed stored product images with a new model version"
+    )
+    parser.add_argument("target", help="model version tag of the new weights")
+    parser.add_argument("--source", default=MODEL_VERSION)
+    parser.add_argument("--model-path", help="weights of the new model")
+    parser.add_argument("--runtime", choices=sorted(RUNTIMES), default="eager")
+    parser.add_argument(
+        "--backbone",
+        choices=sorted(BACKBONES),
+        default="resnet18",
+        help="architecture of eager weights (mobilenet_v3_small for the cascade model)",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="write (or purge) small-model vectors in cascade_image_vectors",
+    )
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument(
+        "--max-rate", type=float, default=None, help="images per second"
+    )
+    parser.add_argument("--pause-ms", type=float, default=0)
+    parser.add_argument(
+        "--purge",
+        action="store_true",
+        help="delete the source version's vectors (after every API runs target)",
+    )
+    args = parser.parse_args(argv)
+    table = CascadeVector if args.cascade else ProductVector
+
+    try:
+        if args.purge:
+            await purge(args.source, args.target, table=table)
+        else:
+            if not args.model_path:
+                parser.error("--model-path is required to re-index")
+            await reindex(
+                args.target,
+                args.model_path,
+                runtime_name=args.runtime,
+                source=args.source,
+                batch_size=args.batch_size,
+                max_rate=args.max_rate,
+                pause_ms=args.pause_ms,
+                backbone=args.backbone,
+                table=table,
+            )
+    finally:
+        await engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
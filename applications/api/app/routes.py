@@ -1,104 +1,190 @@
 import os
-import torch
-import numpy as np
-from typing import List
-from .database import get_db
-from sqlalchemy import insert, select, func, delete
+import json
+import asyncio
+from typing import List, Literal, Optional
+from .database import get_db, lock_image_keys, AsyncSessionLocal
+from sqlalchemy import Float, Text, cast, delete, exists, func, insert, select, text
 from fastapi.params import Form, File
-from .models.model import DeepSearchShoeModel
-from .models.utils import get_image_embedding, cosine_distance_to_percent
+from . import inference, cascade
+from .inference import (
+    embed_image,
+    embed_in_chunks,
+    batcher,
+    cache as embedding_cache,
+    executor as inference_executor,
+)
+from .models.executor import ExecutorBusyError
+from .search import search_products, search_products_many
+from .vector_index import index as vector_index
+from .streaming import (
+    MAX_CONSECUTIVE_SKIPS,
+    LatestFrame,
+    TemporalVoter,
+    frame_signature,
+    frame_difference,
+)
+from .models.utils import cosine_distance_to_percent
+from .storage import image_store
+from .statistics import statistics_cache
+from .versions import MODEL_VERSION, version_complete
+from .metrics import registry as metrics_registry, timed
+from .thumbnails import (
+    THUMBNAIL_SIZES,
+    FORMATS as THUMBNAIL_FORMATS,
+    thumbnail_cache,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from .products import (
+    CascadeVector,
     Product,
     ProductSchema,
     ProductStatisticsResponse,
-    LowStockProduct,
     ProductVector,
 )
 import base64
-from fastapi.responses import Response
-import uuid
+from fastapi.responses import (
+    Response,
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 
 router = APIRouter()
 
-MODEL_PATH = os.path.join(
-    os.path.dirname(__file__), "models/deep_search_shoe_model.pth"
-)
-
-model = DeepSearchShoeModel(embedding_size=128)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-state_dict = torch.load(MODEL_PATH, map_location=device)
-model.load_state_dict(state_dict)
-model.to(device)
-model.eval()
+DEEP_BATCH_MAX_FILES = int(os.getenv("DEEP_BATCH_MAX_FILES", "64"))
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PRODUCTS_PAGE_MAX_SIZE = 1000
+PRODUCTS_STREAM_CHUNK = 500
 
 
-@router.get("/products", tags=["Product"], response_model=list[ProductSchema])
-async def get_products(
-    db: AsyncSession = Depends(get_db),
+def _product_listing_stmt(
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    shelf: Optional[str] = None,
+    low_stock: Optional[int] = None,
 ):
-    stmt = (
-        select(
-            Product.product_code,
-            Product.product_name,
-            Product.description,
-            Product.price,
-            Product.quantity,
-            Product.category,
-            Product.unit,
-            Product.shelf,
-            func.array_agg(ProductVector.id).label("image_id"),
-        )
-        .join(
-            ProductVector,
-            Product.product_code == ProductVector.product_code,
-            isouter=True,
-        )
-        .group_by(
-            Product.product_code,
-            Product.product_name,
-            Product.description,
-            Product.price,
-            Product.quantity,
-            Product.category,
-            Product.unit,
-            Product.shelf,
+    # ให้ Postgres สร้าง JSON ของแต่ละสินค้าเลย ฝั่ง Python แค่ต่อ string ไม่ต้องผ่าน pydantic ทีละแถว
+    image_ids = (
+        select(func.coalesce(func.json_agg(ProductVector.id), text("'[]'::json")))
+        .where(
+            ProductVector.product_code == Product.product_code,
+            ProductVector.model_version == MODEL_VERSION,
         )
-        .order_by(Product.product_code)
+        .scalar_subquery()
+    )
+    row = func.json_build_object(
+        "product_code",
+        Product.product_code,
+        "product_name",
+        Product.product_name,
+        "description",
+        Product.description,
+        "price",
+        cast(Product.price, Float),
+        "quantity",
+        Product.quantity,
+        "category",
+        Product.category,
+        "unit",
+        Product.unit,
+        "shelf",
+        Product.shelf,
+        "image_id",
+        image_ids,
+    )
+    stmt = select(Product.product_code, cast(row, Text).label("json")).order_by(
+        Product.product_code
     )
+    # keyset pagination: ต่อจาก product_code ตัวสุดท้ายของหน้าก่อน ใช้ primary key index ตรงๆ
+    if cursor is not None:
+        stmt = stmt.where(Product.product_code > cursor)
+    if category is not None:
+        stmt = stmt.where(Product.category == category)
+    if shelf is not None:
+        stmt = stmt.where(Product.shelf == shelf)
+    if low_stock is not None:
+        stmt = stmt.where(Product.quantity <= low_stock)
+    return stmt
+
+
+async def _stream_products(stmt, ndjson: bool):
+    # ใช้ session ของตัวเอง เพราะ response ยังส่งอยู่หลัง dependency ปิด session ไปแล้ว
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            stmt.execution_options(yield_per=PRODUCTS_STREAM_CHUNK)
+        )
+        first = True
+        if not ndjson:
+            yield "["
+        async for rows in result.partitions():
+            if ndjson:
+                yield "".join(f"{row.json}\n" for row in rows)
+            else:
+                chunk = ",".join(row.json for row in rows)
+                yield chunk if first else "," + chunk
+                first = False
+        if not ndjson:
+            yield "]"
 
-    result = await db.execute(stmt)
 
-    rows = result.mappings().all()
+@router.get("/products", tags=["Product"], response_model=list[ProductSchema])
+async def get_products(
+    cursor: Optional[str] = Query(
+        None, description="product_code of the last item on the previous page"
+    ),
+    limit: Optional[int] = Query(None, ge=1, le=PRODUCTS_PAGE_MAX_SIZE),
+    category: Optional[str] = None,
+    shelf: Optional[str] = None,
+    low_stock: Optional[int] = Query(
+        None, ge=0, description="only products with quantity <= low_stock"
+    ),
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_db),
+):
+    """List products ordered by product_code.
 
-    products = []
-    for row in rows:
-        raw_image_ids = row["image_id"] or []
+    With ``limit`` one page is returned and ``X-Next-Cursor`` carries the
+    cursor for the next page. Without it the whole (filtered) catalog is
+    streamed, as a JSON array or as NDJSON with ``format=ndjson``.
+    """
+    stmt = _product_listing_stmt(cursor, category, shelf, low_stock)
 
-        image_ids = []
-        for item in raw_image_ids:
-            if item is not None:
-                if isinstance(item, uuid.UUID):
-                    image_ids.append(item)
-                else:
-                    image_ids.append(uuid.UUID(str(item)))
-
-        products.append(
-            ProductSchema(
-                product_code=row["product_code"],
-                product_name=row["product_name"],
-                description=row["description"],
-                price=float(row["price"]),
-                quantity=row["quantity"],
-                category=row["category"],
-                unit=row["unit"],
-                shelf=row["shelf"],
-                image_id=image_ids,
-            )
+    if limit is None:
+        media_type = (
+            "application/x-ndjson" if format == "ndjson" else "application/json"
+        )
+        return StreamingResponse(
+            _stream_products(stmt, format == "ndjson"), media_type=media_type
         )
 
-    return products
+    rows = (await db.execute(stmt.limit(limit + 1))).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = rows[-1].product_code
+
+    if format == "ndjson":
+        return Response(
+            "".join(f"{row.json}\n" for row in rows),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+    return Response(
+        "[" + ",".join(row.json for row in rows) + "]",
+        media_type="application/json",
+        headers=headers,
+    )
 
 
 @router.get(
@@ -106,40 +192,7 @@ async def get_products(
 )
 async def get_product_statistics(db: AsyncSession = Depends(get_db)):
     try:
-        total_stmt = select(func.count(Product.product_code))
-        total_result = await db.execute(total_stmt)
-        total_products = total_result.scalar()
-
-        quantity_stmt = select(func.sum(Product.quantity))
-        quantity_result = await db.execute(quantity_stmt)
-        total_quantity = quantity_result.scalar() or 0
-
-        category_stmt = select(func.count(func.distinct(Product.category)))
-        category_result = await db.execute(category_stmt)
-        total_categories = category_result.scalar()
-
-        low_stock_stmt = (
-            select(Product.product_code, Product.product_name, Product.quantity)
-            .order_by(Product.quantity.asc())
-            .limit(5)
-        )
-        low_stock_result = await db.execute(low_stock_stmt)
-        low_stock_products = low_stock_result.all()
-
-        return ProductStatisticsResponse(
-            total_products=total_products,
-            total_quantity=total_quantity,
-            total_categories=total_categories,
-            low_stock_products=[
-                LowStockProduct(
-                    product_code=row.product_code,
-                    product_name=row.product_name,
-                    quantity=row.quantity,
-                )
-                for row in low_stock_products
-            ],
-        )
-
+        return await statistics_cache.get(db)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error fetching statistics: {str(e)}"
@@ -156,7 +209,8 @@ async def get_product_details(product_code: str, db: AsyncSession = Depends(get_
         raise HTTPException(status_code=404, detail="Product not found")
 
     vector_stmt = select(ProductVector.id).where(
-        ProductVector.product_code == product_code
+        ProductVector.product_code == product_code,
+        ProductVector.model_version == MODEL_VERSION,
     )
     vector_result = await db.execute(vector_stmt)
     image_ids = [row[0] for row in vector_result.all()]
@@ -174,6 +228,7 @@ async def add_product(product: ProductSchema, db: AsyncSession = Depends(get_db)
     db.add(new_product)
     try:
         await db.commit()
+        statistics_cache.invalidate()
         await db.refresh(new_product)
         return new_product
     except Exception as e:
@@ -181,124 +236,467 @@ async def add_product(product: ProductSchema, db: AsyncSession = Depends(get_db)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _insert_cascade_vectors(db, product_code, embeddings, image_keys):
+    # ภาพใหม่ต้องมี vector ของ model เล็กด้วย ไม่งั้น cascade จะหาไม่เจอจนกว่าจะ re-index
+    # ไม่ commit เอง: อยู่ใน transaction เดียวกับ vector ของ model เต็ม
+    rows = [
+        {
+            "product_code": product_code,
+            "embeded": embedding.flatten().tolist(),
+            "image_key": image_key,
+            "model_version": cascade.CASCADE_MODEL_VERSION,
+        }
+        for image_key, embedding in zip(image_keys, embeddings)
+    ]
+    result = await db.execute(
+        insert(CascadeVector).values(rows).returning(CascadeVector.id)
+    )
+    inserted_ids = result.scalars().all()
+    return [(id, product_code, row["embeded"]) for id, row in zip(inserted_ids, rows)]
+
+
 @router.post("/products-vectors", tags=["Product"])
 async def upload_product_vectors(
     product_code: str = Form(...),
     files: List[UploadFile] = File(...),
     db: AsyncSession = Depends(get_db),
 ):
+    image_keys = []
     try:
 
         if len(files) == 0:
             raise HTTPException(status_code=400, detail="No file uploaded")
 
-        vectors_to_insert = []
-
-        for file in files:
-            image_bytes = await file.read()
-            if not image_bytes:
-                raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        images = []
+        with timed("read"):
+            for file in files:
+                image_bytes = await file.read()
+                if not image_bytes:
+                    raise HTTPException(
+                        status_code=400, detail="Uploaded file is empty"
+                    )
+                images.append(image_bytes)
+
+        embeddings = await embed_in_chunks(embed_image, images)
+        small_embeddings = None
+        if cascade.loaded:
+            # embed ด้วย model เล็กให้เสร็จก่อนเขียน DB ถ้าล้มจะยังไม่มีอะไรถูกบันทึก
+            # client จึง retry ได้โดยไม่เกิดแถวซ้ำ
+            small_embeddings = await embed_in_chunks(cascade.embed_image, images)
+
+        with timed("store"):
+            keys = await asyncio.gather(
+                *(asyncio.to_thread(image_store.key_for, b) for b in images)
+            )
+            # ถือ lock ไว้จน commit: การลบไฟล์ที่ไม่มีใครอ้างถึงจะรอจนแถวของเราเข้า DB ก่อน
+            await lock_image_keys(db, keys)
+            image_keys = await asyncio.gather(
+                *(asyncio.to_thread(image_store.put, b) for b in images)
+            )
 
-            embedding = get_image_embedding(model, image_bytes, device)
+        vectors_to_insert = []
+        for image_key, embedding in zip(image_keys, embeddings):
             if embedding is None:
                 raise HTTPException(status_code=500, detail="Failed to get embedding")
-            vector = np.array(embedding).flatten().tolist()
+            vector = embedding.flatten().tolist()
 
-            image_base64 = base64.b64encode(image_bytes).decode("utf-8")
             vectors_to_insert.append(
                 {
                     "product_code": product_code,
                     "embeded": vector,
-                    "image": image_base64,
+                    "image_key": image_key,
+                    "model_version": MODEL_VERSION,
                 }
             )
 
-        stmt = insert(ProductVector).values(vectors_to_insert)
-        await db.execute(stmt)
+        stmt = (
+            insert(ProductVector).values(vectors_to_insert).returning(ProductVector.id)
+        )
+        result = await db.execute(stmt)
+        inserted_ids = result.scalars().all()
+        cascade_items = []
+        if small_embeddings is not None:
+            cascade_items = await _insert_cascade_vectors(
+                db, product_code, small_embeddings, image_keys
+            )
         await db.commit()
 
+        if vector_index.ready:
+            with timed("index"):
+                vector_index.add_many(
+                    (id, product_code, item["embeded"])
+                    for id, item in zip(inserted_ids, vectors_to_insert)
+                )
+
+        if cascade_items and cascade.index.ready:
+            cascade.index.add_many(cascade_items)
+
         return {
             "status": "success",
             "product_code": product_code,
         }
 
+    except ExecutorBusyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         await db.rollback()
+        await _discard_stored_images(db, image_keys)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _discard_stored_images(db: AsyncSession, image_keys):
+    # insert ล้มหลัง put ไฟล์ไปแล้ว: ลบไฟล์ที่ไม่มีแถวไหนอ้างถึงไม่ให้ค้างใน store
+    try:
+        await _delete_unreferenced_images(db, image_keys)
+    except Exception:
+        # DB ยังใช้ไม่ได้ ไฟล์จะค้างอยู่แต่ไม่กระทบผลของ request
+        await db.rollback()
+
+
+def _to_similarity_matches(matches):
+    return [
+        {
+            "product_code": match.product_code,
+            "similarity": cosine_distance_to_percent(match.distance),
+        }
+        for match in matches
+    ]
+
+
+MATCH_SIMILARITY = 50
+
+
+def _is_match(unique_matches):
+    return any(match["similarity"] >= MATCH_SIMILARITY for match in unique_matches)
+
+
 @router.post("/deep", tags=["Product"])
 async def upload_product_vectors(
-    file: UploadFile = File(...), db: AsyncSession = Depends(get_db)
+    file: UploadFile = File(...),
+    k: int = Query(5, ge=1, le=50),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000),
+    probes: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_db),
 ):
     try:
         if not file:
             raise HTTPException(status_code=400, detail="No file uploaded")
 
-        image_bytes = await file.read()
+        with timed("read"):
+            image_bytes = await file.read()
         if not image_bytes:
             raise HTTPException(status_code=400, detail="Uploaded file is empty")
 
-        embedding = get_image_embedding(model, image_bytes, device)
-        if embedding is None:
-            raise HTTPException(status_code=500, detail="Failed to generate embedding")
+        matches, tensor = None, None
+        if await cascade.ready():
+            # model เล็กตอบก่อน ส่งต่อให้ model เต็มเฉพาะ query ที่อันดับ 1 กับ 2 สูสีกัน
+            matches, tensor = await cascade.search(
+                image_bytes, k=k, nprobe=probes, min_similarity=MATCH_SIMILARITY
+            )
 
-        vector = np.array(embedding).flatten()
+        if matches is None:
+            embedding = await embed_image(image_bytes, tensor)
+            if embedding is None:
+                raise HTTPException(
+                    status_code=500, detail="Failed to generate embedding"
+                )
 
-        stmt = (
-            select(
-                ProductVector.id,
-                ProductVector.product_code,
-                ProductVector.embeded.cosine_distance(vector).label("distance"),
-            )
-            .order_by("distance")
-            .limit(10)
-        )
+            vector = embedding.flatten()
 
-        result = await db.execute(stmt)
-        rows = result.all()
-
-        seen = set()
-        unique_matches = []
-        for row in rows:
-            if row.product_code not in seen:
-                distance = cosine_distance_to_percent(row.distance)
-                unique_matches.append(
-                    {
-                        # "id": str(row.id),
-                        "product_code": row.product_code,
-                        "similarity": distance,
-                    }
+            with timed("search"):
+                matches = await search_products(
+                    db, vector, k=k, ef_search=ef_search, probes=probes
                 )
-                seen.add(row.product_code)
-            if len(unique_matches) >= 5:
-                break
+        with timed("respond"):
+            unique_matches = _to_similarity_matches(matches)
 
-            if not unique_matches or all(
-                match["similarity"] < 50 for match in unique_matches
-            ):
-                raise HTTPException(status_code=400, detail="Image not match")
+        if not _is_match(unique_matches):
+            raise HTTPException(status_code=400, detail="Image not match")
 
         return {"matches": unique_matches}
 
     except HTTPException as e:
         raise e
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.post("/deep/batch", tags=["Product"])
+async def search_products_batch(
+    files: List[UploadFile] = File(...),
+    k: int = Query(5, ge=1, le=50),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000),
+    probes: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_db),
+):
+    if len(files) == 0:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    if len(files) > DEEP_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files (max {DEEP_BATCH_MAX_FILES} per request)",
+        )
+
+    results = [{"filename": file.filename} for file in files]
+    images = {}
+    for i, file in enumerate(files):
+        image_bytes = await file.read()
+        if image_bytes:
+            images[i] = image_bytes
+        else:
+            results[i].update(status_code=400, detail="Uploaded file is empty")
+
+    # ส่งเป็นก้อนละ batch ของ model เพื่อให้ได้ forward pass เต็ม batch
+    # และไม่ดันคิวของ executor จนเต็มเพราะ request เดียว
+    order = list(images)
+    embeddings = {}
+    for start in range(0, len(order), batcher.max_batch_size):
+        chunk = order[start : start + batcher.max_batch_size]
+        outputs = await asyncio.gather(
+            *(embed_image(images[i]) for i in chunk), return_exceptions=True
+        )
+        for i, output in zip(chunk, outputs):
+            if isinstance(output, ExecutorBusyError):
+                results[i].update(status_code=503, detail=str(output))
+            elif isinstance(output, Exception) or output is None:
+                results[i].update(
+                    status_code=422, detail=f"Failed to generate embedding: {output}"
+                )
+            else:
+                embeddings[i] = output.flatten()
+
+    try:
+        all_matches = await search_products_many(
+            db, list(embeddings.values()), k=k, ef_search=ef_search, probes=probes
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+    for i, matches in zip(embeddings, all_matches):
+        unique_matches = _to_similarity_matches(matches)
+        if _is_match(unique_matches):
+            results[i].update(status_code=200, matches=unique_matches)
+        else:
+            results[i].update(status_code=400, detail="Image not match")
+
+    return {"results": results}
+
+
+@router.websocket("/deep/stream")
+async def stream_search(
+    websocket: WebSocket,
+    k: int = Query(3, ge=1, le=50),
+    window: int = Query(8, ge=1, le=64),
+    min_votes: int = Query(5, ge=1, le=64),
+    diff_threshold: float = Query(0.02, ge=0, le=1),
+):
+    """Continuous search over a stream of binary JPEG/PNG frames.
+
+    Send frames as binary messages and ``{"action": "reset"}`` as text to
+    start a new product. The server replies with ``progress`` messages per
+    handled frame and a ``match`` message once the vote is stable.
+    """
+    await websocket.accept()
+    frames = LatestFrame()
+    voter = TemporalVoter(window=window, min_votes=min_votes)
+
+    async def receive():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                frames.put(message["bytes"])
+            elif message.get("text"):
+                try:
+                    action = json.loads(message["text"]).get("action")
+                except (ValueError, AttributeError):
+                    action = None
+                if action == "reset":
+                    voter.reset()
+
+    async def process():
+        last_signature = None
+        processed = skipped = consecutive_skips = 0
+        while True:
+            frame = await frames.get()
+            try:
+                signature = await inference_executor.run(frame_signature, frame)
+                if (
+                    last_signature is not None
+                    and consecutive_skips < MAX_CONSECUTIVE_SKIPS
+                    and frame_difference(signature, last_signature) < diff_threshold
+                ):
+                    # ภาพแทบไม่ต่างจากเฟรมก่อน ใช้ผลเดิมโหวตซ้ำ ไม่ต้อง forward pass
+                    skipped += 1
+                    consecutive_skips += 1
+                    voter.repeat()
+                else:
+                    embedding = await embed_image(frame)
+                    async with AsyncSessionLocal() as db:
+                        matches = await search_products(db, embedding.flatten(), k=k)
+                    unique_matches = _to_similarity_matches(matches)
+                    if _is_match(unique_matches):
+                        best = unique_matches[0]
+                        voter.add(best["product_code"], best["similarity"])
+                    else:
+                        voter.add(None)
+                    last_signature = signature
+                    processed += 1
+                    consecutive_skips = 0
+            except ExecutorBusyError:
+                frames.dropped += 1
+                continue
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+
+            leader, votes = voter.leader()
+            await websocket.send_json(
+                {
+                    "type": "progress",
+                    "leader": leader,
+                    "votes": votes,
+                    "window": window,
+                    "frames_received": frames.received,
+                    "frames_processed": processed,
+                    "frames_skipped": skipped,
+                    "frames_dropped": frames.dropped,
+                }
+            )
+
+            stable = voter.stable()
+            if stable is not None and stable != voter.reported:
+                voter.reported = stable
+                await websocket.send_json(
+                    {
+                        "type": "match",
+                        "product_code": stable,
+                        "similarity": voter.similarity(stable),
+                        "votes": votes,
+                        "frames_processed": processed,
+                    }
+                )
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(process())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                if not isinstance(task.exception(), WebSocketDisconnect):
+                    raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def _delete_unreferenced_images(db: AsyncSession, image_keys):
+    image_keys = {key for key in image_keys if key}
+    if not image_keys:
+        return
+    # upload ที่ใช้ไฟล์เดียวกันและ put ไปแล้วจะ commit แถวของมันก่อนเราได้ lock
+    # จึงเห็นแถวนั้นตอนตรวจด้านล่าง; upload ที่มาทีหลังจะ put ไฟล์ใหม่หลังเราลบเสร็จ
+    await lock_image_keys(db, image_keys)
+    result = await db.execute(
+        select(ProductVector.image_key)
+        .where(ProductVector.image_key.in_(image_keys))
+        .union(
+            select(CascadeVector.image_key).where(
+                CascadeVector.image_key.in_(image_keys)
+            )
+        )
+    )
+    # ไฟล์เดียวกันอาจถูกใช้หลายแถว (อัปโหลดภาพซ้ำ) ลบเฉพาะที่ไม่มีใครอ้างถึงแล้ว
+    for key in image_keys - set(result.scalars().all()):
+        await asyncio.to_thread(image_store.delete, key)
+        await asyncio.to_thread(thumbnail_cache.invalidate, _thumbnail_source(key))
+    await db.commit()
+
+
+def _thumbnail_source(image_key: str) -> str:
+    return image_key.split(".")[0]
+
 
 @router.get("/products/image/{id}", tags=["Product"])
-async def get_product_image(id: str, db: AsyncSession = Depends(get_db)):
+async def get_product_image(
+    id: str,
+    request: Request,
+    size: Optional[int] = Query(
+        None, description=f"Thumbnail size in px, one of {list(THUMBNAIL_SIZES)}"
+    ),
+    format: Literal["webp", "jpeg"] = Query("webp"),
+    db: AsyncSession = Depends(get_db),
+):
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported size {size}, expected one of {list(THUMBNAIL_SIZES)}",
+        )
+
     try:
-        result = await db.execute(select(ProductVector).where(ProductVector.id == id))
-        product = result.scalars().first()
+        result = await db.execute(
+            select(ProductVector.image_key, ProductVector.image).where(
+                ProductVector.id == id
+            )
+        )
+        product = result.first()
 
-        if not product or not product.image:
+        if not product or not (product.image_key or product.image):
             raise HTTPException(status_code=404, detail="Image not found")
 
-        image_blob = base64.b64decode(product.image)
-        return Response(content=image_blob, media_type="image/jpeg")
+        if product.image_key:
+            path = image_store.path(product.image_key)
+            if not os.path.exists(path):
+                raise HTTPException(status_code=404, detail="Image not found")
+            source = _thumbnail_source(product.image_key)
+        else:
+            # แถวเก่าที่ยังไม่ได้ย้ายออกจาก column image (ดู app/migrate_images.py)
+            path = None
+            source = f"row-{id}"
+
+        if size is None and path is None:
+            image_blob = base64.b64decode(product.image)
+            return Response(content=image_blob, media_type="image/jpeg")
+
+        # key เป็น hash ของเนื้อไฟล์ ไฟล์ของ key หนึ่งจึงไม่มีวันเปลี่ยน cache ได้ตลอด
+        etag = f'"{source}"' if size is None else f'"{source}-{size}-{format}"'
+        headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        if size is None:
+            return FileResponse(
+                path,
+                media_type=image_store.media_type(product.image_key),
+                headers=headers,
+            )
+
+        def load_original():
+            if path is None:
+                return base64.b64decode(product.image)
+            with open(path, "rb") as f:
+                return f.read()
 
+        thumbnail_path = await asyncio.to_thread(
+            thumbnail_cache.get_or_create, source, size, format, load_original
+        )
+        return FileResponse(
+            thumbnail_path, media_type=THUMBNAIL_FORMATS[format][1], headers=headers
+        )
+
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
@@ -312,12 +710,25 @@ async def delete_product(product_code: str, db: AsyncSession = Depends(get_db)):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
+    result = await db.execute(
+        delete(ProductVector)
+        .where(ProductVector.product_code == product_code)
+        .returning(ProductVector.id, ProductVector.image_key)
+    )
+    deleted = result.all()
     await db.execute(
-        delete(ProductVector).where(ProductVector.product_code == product_code)
+        delete(CascadeVector).where(CascadeVector.product_code == product_code)
     )
 
     await db.delete(product)
     await db.commit()
+    statistics_cache.invalidate()
+    vector_index.remove_product(product_code)
+    cascade.index.remove_product(product_code)
+    await _delete_unreferenced_images(db, [row.image_key for row in deleted])
+    for row in deleted:
+        if not row.image_key:
+            await asyncio.to_thread(thumbnail_cache.invalidate, f"row-{row.id}")
 
     return
 
@@ -330,7 +741,45 @@ async def delete_product(id: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="ProductVector not found")
 
     await db.delete(product)
+    copies = []
+    cascade_ids = []
+    if product.image_key:
+        # ลบสำเนาของภาพเดียวกันที่ถูก re-index ไว้สำหรับ model version อื่นด้วย
+        # แต่ไม่แตะภาพซ้ำของ version เดียวกัน (อัปโหลดซ้ำ) ที่เป็นแถวของมันเอง
+        result = await db.execute(
+            delete(ProductVector)
+            .where(
+                ProductVector.product_code == product.product_code,
+                ProductVector.image_key == product.image_key,
+                ProductVector.model_version != product.model_version,
+                ProductVector.id != product.id,
+            )
+            .returning(ProductVector.id)
+        )
+        copies = result.scalars().all()
+        # vector ของ model เล็กของภาพเดียวกัน เมื่อไม่เหลือแถวไหนใช้ภาพนี้แล้ว
+        result = await db.execute(
+            delete(CascadeVector)
+            .where(
+                CascadeVector.product_code == product.product_code,
+                CascadeVector.image_key == product.image_key,
+                ~exists().where(
+                    ProductVector.product_code == product.product_code,
+                    ProductVector.image_key == product.image_key,
+                    ProductVector.id != product.id,
+                ),
+            )
+            .returning(CascadeVector.id)
+        )
+        cascade_ids = result.scalars().all()
     await db.commit()
+    for vector_id in [product.id, *copies]:
+        vector_index.remove(vector_id)
+    for vector_id in cascade_ids:
+        cascade.index.remove(vector_id)
+    await _delete_unreferenced_images(db, [product.image_key])
+    if not product.image_key:
+        await asyncio.to_thread(thumbnail_cache.invalidate, f"row-{product.id}")
 
     return
 
@@ -354,10 +803,12 @@ async def update_product(
 
     db.add(product)
     await db.commit()
+    statistics_cache.invalidate()
     await db.refresh(product)
 
     vector_stmt = select(ProductVector.id).where(
-        ProductVector.product_code == product_code
+        ProductVector.product_code == product_code,
+        ProductVector.model_version == MODEL_VERSION,
     )
     vector_result = await db.execute(vector_stmt)
     image_ids = [row[0] for row in vector_result.all()]
@@ -365,3 +816,51 @@ async def update_product(
     product_data = ProductSchema.model_validate(product)
     product_data.image_id = image_ids
     return product_data
+
+
+@router.get("/healthz", tags=["System"])
+async def healthz():
+    return {"status": "ok"}
+
+
+@router.get("/readyz", tags=["System"])
+async def readyz(request: Request):
+    # รับ traffic ได้หลังโหลด model และ warmup เสร็จแล้ว และ vector ของ model version นี้ครบแล้ว
+    try:
+        embeddings_ready = await version_complete(MODEL_VERSION)
+    except Exception:
+        embeddings_ready = False
+    ready = inference.ready and embeddings_ready
+    body = {
+        "ready": ready,
+        "model_version": MODEL_VERSION,
+        "embeddings": embeddings_ready,
+        "vector_index": vector_index.ready,
+        "cold_start": {
+            **inference.cold_start,
+            "startup_seconds": getattr(request.app.state, "startup_seconds", None),
+        },
+    }
+    if not ready:
+        return JSONResponse(body, status_code=503)
+    return body
+
+
+@router.get("/metrics", tags=["System"], response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics_registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@router.get("/cache/stats", tags=["System"])
+async def get_cache_stats():
+    return embedding_cache.stats()
+
+
+@router.get("/index/stats", tags=["System"])
+async def get_index_stats(recall_sample: int = 0, k: int = 10):
+    stats = vector_index.stats()
+    if recall_sample > 0 and vector_index.ready:
+        stats[f"recall@{k}"] = vector_index.recall(k=k, sample=recall_sample)
+    return stats
@@ -0,0 +1,144 @@
+import os
+from dotenv import load_dotenv
+from pgvector.sqlalchemy import HALFVEC
+from sqlalchemy import select, func, values, column, cast, true, Integer
+from .products import ProductVector
+from .vector_index import Match, index as vector_index, rescore
+from .versions import MODEL_VERSION
+
+load_dotenv()
+
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+# pgvector ไม่ยอมให้ตั้ง hnsw.ef_search เกิน 1000
+MAX_EF_SEARCH = 1000
+# filter model_version ถูกใช้หลังสแกน index: iterative scan (pgvector >= 0.8) สแกนต่อจนได้ครบ LIMIT
+# แทนที่จะหยุดที่ ef_search แถว แต่ไม่เกินจำนวน tuple นี้ต่อ query
+HNSW_MAX_SCAN_TUPLES = int(os.getenv("HNSW_MAX_SCAN_TUPLES", "20000"))
+# ค้นรอบแรกบน HNSW index ของ embeded::halfvec (migration 004) แล้วจัดอันดับใหม่ด้วย vector เต็ม
+PGVECTOR_HALFVEC = os.getenv("PGVECTOR_HALFVEC", "0") == "1"
+# index ใน memory แบบ int8: ดึง candidate มากกว่า k กี่เท่าเพื่อนำไป rescore
+ANN_RESCORE_FACTOR = int(os.getenv("ANN_RESCORE_FACTOR", "4"))
+
+
+async def search_products(db, vector, k=5, ef_search=None, probes=None):
+    """Return the ``k`` closest distinct products as ``Match`` tuples.
+
+    Each product appears once with the distance of its best image. Uses the
+    in-memory index when it is loaded, otherwise pgvector.
+    """
+    (matches,) = await search_products_many(db, [vector], k, ef_search, probes)
+    return matches
+
+
+async def search_products_many(db, vectors, k=5, ef_search=None, probes=None):
+    """``search_products`` for several query vectors at once."""
+    if not len(vectors):
+        return []
+    if vector_index.ready:
+        if not vector_index.compressed:
+            return vector_index.search_products_many(vectors, k=k, nprobe=probes)
+        candidates = vector_index.search_products_many(
+            vectors, k=k * ANN_RESCORE_FACTOR, nprobe=probes
+        )
+        return await _rescore_from_db(db, vectors, candidates, k)
+    return await search_products_db(db, vectors, k, ef_search, probes)
+
+
+async def _rescore_from_db(db, vectors, candidates, k):
+    # index int8 ไม่เก็บ vector เต็มไว้ใน memory จึงอ่านเฉพาะ candidate จาก DB ด้วย primary key
+    ids = {match.id for matches in candidates for match in matches}
+    if not ids:
+        return candidates
+    rows = await db.execute(
+        select(ProductVector.id, ProductVector.embeded).where(ProductVector.id.in_(ids))
+    )
+    full = {str(row.id): row.embeded for row in rows}
+    return rescore(vectors, candidates, full, k)
+
+
+def _nearest_products_stmt(vectors, candidates):
+    vector_type = ProductVector.embeded.type
+    queries = values(
+        column("idx", Integer), column("embedding", vector_type), name="queries"
+    ).data(list(vectors))
+
+    # parameter ใน VALUES ไม่มี type ให้ postgres อนุมาน จึงต้อง cast เป็น vector เอง
+    query = cast(queries.c.embedding, vector_type)
+    distance = ProductVector.embeded.cosine_distance(query)
+    order = distance
+    if PGVECTOR_HALFVEC:
+        # ต้องเขียน expression ให้ตรงกับ index (embeded::halfvec(128)) ถึงจะใช้ index ได้
+        halfvec = HALFVEC(vector_type.dim)
+        order = cast(ProductVector.embeded, halfvec).cosine_distance(
+            cast(query, halfvec)
+        )
+    nearest = (
+        select(
+            ProductVector.id,
+            ProductVector.product_code,
+            distance.label("distance"),
+        )
+        .where(ProductVector.model_version == MODEL_VERSION)
+        .order_by(order)
+        .limit(candidates)
+        .lateral("nearest")
+    )
+    # window คำนวณก่อน DISTINCT ON จึงได้จำนวน candidate ทั้งหมดของแต่ละ query
+    return (
+        select(
+            queries.c.idx,
+            nearest.c.id,
+            nearest.c.product_code,
+            nearest.c.distance,
+            func.count().over(partition_by=queries.c.idx).label("scanned"),
+        )
+        .select_from(queries.join(nearest, true()))
+        .distinct(queries.c.idx, nearest.c.product_code)
+        .order_by(queries.c.idx, nearest.c.product_code, nearest.c.distance)
+    )
+
+
+async def search_products_db(db, vectors, k=5, ef_search=None, probes=None):
+    ef_search = ef_search or HNSW_EF_SEARCH
+    probes = probes or IVFFLAT_PROBES
+    candidates = max(4 * k, ef_search)
+
+    results = [[] for _ in vectors]
+    pending = list(enumerate(vectors))
+    while pending:
+        # set_config(..., true) มีผลแค่ใน transaction นี้ ไม่รั่วไปถึง request อื่นใน pool
+        await db.execute(
+            select(
+                func.set_config(
+                    "hnsw.ef_search", str(min(candidates, MAX_EF_SEARCH)), True
+                ),
+                func.set_config("ivfflat.probes", str(probes), True),
+                # strict_order: แถวที่ได้ยังเรียงตาม distance จริง LIMIT จึงไม่ตัดแถวที่ใกล้กว่าทิ้ง
+                func.set_config("hnsw.iterative_scan", "strict_order", True),
+                func.set_config(
+                    "hnsw.max_scan_tuples", str(HNSW_MAX_SCAN_TUPLES), True
+                ),
+                func.set_config("ivfflat.iterative_scan", "relaxed_order", True),
+            )
+        )
+        rows = (await db.execute(_nearest_products_stmt(pending, candidates))).all()
+
+        scanned = {}
+        found = {i: [] for i, _ in pending}
+        for row in rows:
+            found[row.idx].append(Match(row.id, row.product_code, row.distance))
+            scanned[row.idx] = row.scanned
+
+        retry = []
+        for i, vector in pending:
+            matches = sorted(found[i], key=lambda match: match.distance)
+            results[i] = matches[:k]
+            # ได้สินค้าไม่ครบ k ทั้งที่ candidate ยังไม่หมดตาราง แปลว่าบางสินค้ามีหลายภาพ
+            # กินที่ candidate ไป ให้ขยาย candidate แล้วค้นใหม่เฉพาะ query นั้น
+            if len(matches) < k and scanned.get(i, 0) >= candidates:
+                retry.append((i, vector))
+        pending = retry
+        candidates *= 4
+
+    return results
@@ -0,0 +1,96 @@
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+from sqlalchemy import JSON, select, func, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from .products import Product, ProductStatisticsResponse, LowStockProduct
+
+load_dotenv()
+
+STATISTICS_CACHE_TTL_SECONDS = float(os.getenv("STATISTICS_CACHE_TTL_SECONDS", "30"))
+LOW_STOCK_LIMIT = 5
+
+
+def statistics_stmt():
+    low_stock = (
+        select(Product.product_code, Product.product_name, Product.quantity)
+        .order_by(Product.quantity.asc())
+        .limit(LOW_STOCK_LIMIT)
+        .subquery()
+    )
+    low_stock_json = select(
+        func.coalesce(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        "product_code",
+                        low_stock.c.product_code,
+                        "product_name",
+                        low_stock.c.product_name,
+                        "quantity",
+                        low_stock.c.quantity,
+                    ),
+                    low_stock.c.quantity,
+                )
+            ),
+            text("'[]'::json"),
+            type_=JSON,
+        )
+    ).scalar_subquery()
+
+    # รวมทั้ง 4 ค่าไว้ใน query เดียว แทนที่จะยิงไป DB 4 รอบ
+    return select(
+        func.count(Product.product_code).label("total_products"),
+        func.coalesce(func.sum(Product.quantity), 0).label("total_quantity"),
+        func.count(func.distinct(Product.category)).label("total_categories"),
+        low_stock_json.label("low_stock_products"),
+    )
+
+
+async def fetch_statistics(db) -> ProductStatisticsResponse:
+    row = (await db.execute(statistics_stmt())).one()
+    return ProductStatisticsResponse(
+        total_products=row.total_products,
+        total_quantity=row.total_quantity,
+        total_categories=row.total_categories,
+        low_stock_products=[LowStockProduct(**item) for item in row.low_stock_products],
+    )
+
+
+class StatisticsCache:
+    """In-process TTL cache for ``/products/statistics``.
+
+    Product writes call ``invalidate()``. A generation counter makes sure a
+    result computed before an invalidation is never stored, and concurrent
+    misses share one query. Each worker has its own copy, so other workers
+    see a write at most ``ttl`` seconds later.
+    """
+
+    def __init__(self, ttl=STATISTICS_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0.0
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._generation += 1
+        self._value = None
+
+    async def get(self, db) -> ProductStatisticsResponse:
+        if self._value is not None and time.monotonic() < self._expires:
+            return self._value
+
+        async with self._lock:
+            if self._value is not None and time.monotonic() < self._expires:
+                return self._value
+            generation = self._generation
+            value = await fetch_statistics(db)
+            if self.ttl > 0 and generation == self._generation:
+                self._value = value
+                self._expires = time.monotonic() + self.ttl
+            return value
+
+
+statistics_cache = StatisticsCache()
@@ -0,0 +1,95 @@
+import os
+import hashlib
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IMAGE_STORE_DIR = os.getenv(
+    "IMAGE_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "images"),
+)
+
+MEDIA_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "gif": "image/gif",
+    "bmp": "image/bmp",
+    "bin": "application/octet-stream",
+}
+
+
+def detect_extension(data: bytes) -> str:
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if data[:2] == b"BM":
+        return "bmp"
+    return "bin"
+
+
+class ImageStore:
+    """Content-addressed image files: ``<sha256>.<ext>`` under a fan-out tree.
+
+    The same bytes always map to the same key, so re-uploads are stored once
+    and a key's file never changes after it is written.
+    """
+
+    def __init__(self, root=IMAGE_STORE_DIR):
+        self.root = root
+
+    @staticmethod
+    def key_for(data: bytes) -> str:
+        return f"{hashlib.sha256(data).hexdigest()}.{detect_extension(data)}"
+
+    def path(self, key: str) -> str:
+        # กัน key แปลกๆ หลุดออกนอก root
+        if os.path.basename(key) != key:
+            raise ValueError(f"Invalid image key: {key}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put(self, data: bytes) -> str:
+        key = self.key_for(data)
+        path = self.path(key)
+        if os.path.exists(path):
+            return key
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # rename เป็น atomic จึงไม่มีใครอ่านเจอไฟล์ที่เขียนไม่ครบ
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key
+
+    def read(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def media_type(key: str) -> str:
+        return MEDIA_TYPES.get(key.rsplit(".", 1)[-1], MEDIA_TYPES["bin"])
+
+
+image_store = ImageStore()
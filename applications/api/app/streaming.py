@@ -0,0 +1,94 @@
+import asyncio
+import numpy as np
+from io import BytesIO
+from PIL import Image
+from collections import Counter, deque
+
+SIGNATURE_SIZE = (32, 32)
+# กล้องนิ่งนานๆ จะไม่มีเฟรมที่ต่างเลย บังคับ inference ใหม่ทุกๆ n เฟรมที่ข้าม
+MAX_CONSECUTIVE_SKIPS = 3
+
+
+def frame_signature(image_bytes: bytes):
+    # decode แบบย่อขนาดตั้งแต่ขั้น JPEG (draft) ได้ภาพเล็กมากในราคาถูก ใช้เทียบว่าเฟรมเปลี่ยนไหม
+    img = Image.open(BytesIO(image_bytes))
+    img.draft("L", (SIGNATURE_SIZE[0] * 4, SIGNATURE_SIZE[1] * 4))
+    img = img.convert("L").resize(SIGNATURE_SIZE, Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32) / 255
+
+
+def frame_difference(a, b) -> float:
+    return float(np.abs(a - b).mean())
+
+
+class LatestFrame:
+    """Single-slot mailbox: a new frame replaces the one still waiting.
+
+    When inference falls behind, stale frames are dropped instead of
+    queueing, so the stream always works on the most recent view.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame: bytes):
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._event.set()
+
+    async def get(self) -> bytes:
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class TemporalVoter:
+    """Sliding-window vote over the top product of recent frames.
+
+    A product is reported once it holds at least ``min_votes`` of the last
+    ``window`` frames. Frames without a confident match vote ``None``.
+    Skipped near-duplicate frames repeat the previous vote, but at least
+    ``min_fresh`` of the leader's votes must come from real inferences.
+    """
+
+    def __init__(self, window=8, min_votes=5, min_fresh=2):
+        self.window = window
+        self.min_votes = min(min_votes, window)
+        self.min_fresh = min(min_fresh, self.min_votes)
+        self._votes = deque(maxlen=window)
+        self.reported = None
+
+    def add(self, product_code, similarity=None):
+        self._votes.append((product_code, similarity, True))
+
+    def repeat(self):
+        if self._votes:
+            product_code, similarity, _ = self._votes[-1]
+            self._votes.append((product_code, similarity, False))
+
+    def reset(self):
+        self._votes.clear()
+        self.reported = None
+
+    def leader(self):
+        counts = Counter(code for code, _, _ in self._votes if code is not None)
+        if not counts:
+            return None, 0
+        return counts.most_common(1)[0]
+
+    def similarity(self, product_code):
+        values = [s for code, s, _ in self._votes if code == product_code]
+        return sum(values) / len(values) if values else 0.0
+
+    def stable(self):
+        product_code, votes = self.leader()
+        if product_code is None or votes < self.min_votes:
+            return None
+        fresh = sum(1 for code, _, f in self._votes if code == product_code and f)
+        return product_code if fresh >= self.min_fresh else None
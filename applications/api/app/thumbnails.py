@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+THUMBNAIL_DIR = os.getenv(
+    "THUMBNAIL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "thumbnails"),
+)
+THUMBNAIL_SIZES = tuple(
+    int(size) for size in os.getenv("THUMBNAIL_SIZES", "128,256,512").split(",")
+)
+THUMBNAIL_CACHE_MAX_MB = float(os.getenv("THUMBNAIL_CACHE_MAX_MB", "512"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+def render_thumbnail(data: bytes, size: int, fmt: str) -> bytes:
+    img = Image.open(BytesIO(data))
+    # JPEG decode แบบย่อขนาด (DCT scaling) ไม่ต้องถอดรหัสเต็มความละเอียด
+    img.draft("RGB", (size, size))
+    # ภาพจากมือถือเก็บทิศทางไว้ใน EXIF Orientation หมุนให้ตรงก่อนย่อ
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((size, size), Image.LANCZOS)
+    if fmt == "jpeg" or img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+
+    out = BytesIO()
+    img.save(out, FORMATS[fmt][0], quality=THUMBNAIL_QUALITY)
+    return out.getvalue()
+
+
+class ThumbnailCache:
+    """Bounded on-disk cache of resized renditions: ``<root>/<source>/<size>.<fmt>``.
+
+    ``source`` identifies the original image (its content hash, or the row id
+    for images still stored as base64). When the cache grows past
+    ``max_bytes`` the least recently used files are evicted.
+    """
+
+    def __init__(self, root=THUMBNAIL_DIR, max_bytes=512 * 2**20):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._bytes = None
+        self._lock = threading.Lock()
+
+    def path(self, source: str, size: int, fmt: str) -> str:
+        if os.path.basename(source) != source:
+            raise ValueError(f"Invalid thumbnail source: {source}")
+        return os.path.join(self.root, source, f"{size}.{fmt}")
+
+    def get_or_create(self, source: str, size: int, fmt: str, load_original) -> str:
+        """Return the path of the rendition, rendering it from ``load_original()``
+        on a miss. Blocking; call it from a worker thread."""
+        path = self.path(source, size, fmt)
+        try:
+            # ใช้ mtime เป็นเวลาใช้งานล่าสุดสำหรับ LRU (atime มักถูกปิดบน filesystem)
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        data = render_thumbnail(load_original(), size, fmt)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # link สร้างไฟล์แบบ atomic และล้มถ้ามีอยู่แล้ว จึงรู้ว่าเราเป็นคนเพิ่มไฟล์นี้จริง
+            # ถ้า render พร้อมกันอีกตัวเขียนไว้ก่อน ใช้ไฟล์นั้นและไม่นับขนาดซ้ำ
+            os.link(tmp_path, path)
+            created = True
+        except FileExistsError:
+            created = False
+        finally:
+            os.remove(tmp_path)
+
+        if created:
+            with self._lock:
+                if self._bytes is None:
+                    # scan ครั้งแรกนับไฟล์ที่เพิ่งเขียนไปแล้ว
+                    self._bytes = self._scan_size()
+                else:
+                    self._bytes += len(data)
+                if self._bytes > self.max_bytes:
+                    self._evict()
+        return path
+
+    def invalidate(self, source: str):
+        directory = os.path.join(self.root, source)
+        removed = 0
+        for _, size, path in self._files(directory):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += size
+        shutil.rmtree(directory, ignore_errors=True)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes = max(self._bytes - removed, 0)
+
+    def _files(self, root=None):
+        for dirpath, _, filenames in os.walk(root or self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        # ไฟล์ .tmp ของ render ที่ยังเขียนอยู่จะถูกนับตอน link สำเร็จ
+        return sum(size for _, size, path in self._files() if not path.endswith(".tmp"))
+
+    def _evict(self):
+        # ลบจนเหลือ 90% ของเพดาน จะได้ไม่ต้องไล่ลบทุกครั้งที่เขียนไฟล์ใหม่
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(self._files()):
+            if self._bytes <= target:
+                break
+            if path.endswith(".tmp"):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._bytes -= size
+
+
+thumbnail_cache = ThumbnailCache(max_bytes=int(THUMBNAIL_CACHE_MAX_MB * 2**20))
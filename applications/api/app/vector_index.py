@@ -0,0 +1,511 @@
+import os
+import math
+import asyncio
+import logging
+import numpy as np
+from collections import namedtuple
+from dotenv import load_dotenv
+from sqlalchemy import select
+from .database import AsyncSessionLocal
+from .products import ProductVector
+from .versions import MODEL_VERSION
+
+load_dotenv()
+
+ANN_INDEX = os.getenv("ANN_INDEX", "1") == "1"
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0")) or None
+ANN_EXACT_THRESHOLD = int(os.getenv("ANN_EXACT_THRESHOLD", "2000"))
+# แต่ละ uvicorn worker มี index ของตัวเองที่เห็นแค่การเพิ่ม/ลบของ worker นั้น
+# เมื่อรันหลาย worker จึง refresh จาก DB เป็นระยะโดย default
+API_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+ANN_REFRESH_SECONDS = float(
+    os.getenv("ANN_REFRESH_SECONDS") or ("10" if API_WORKERS > 1 else "0")
+)
+ANN_STORAGE = os.getenv("ANN_STORAGE", "float32")
+
+logger = logging.getLogger("app.ann")
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+# ความละเอียดที่ใช้เก็บ vector ใน memory: float16 ครึ่งหนึ่ง, int8 หนึ่งในสี่ของ float32
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+SCORE_BLOCK_ROWS = 4096
+
+Match = namedtuple("Match", ["id", "product_code", "distance"])
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """In-memory IVF-flat index over the embeddings in product_image_vectors.
+
+    Vectors are L2-normalised so cosine distance is ``1 - dot``, matching
+    pgvector's ``cosine_distance``. Below ``exact_threshold`` vectors the
+    index simply scans everything, which is faster than probing lists.
+
+    ``storage`` picks how vectors are kept in memory. ``float16`` is close
+    enough to use as is; ``int8`` (per-dimension scalar quantization) is
+    meant as a first pass whose candidates are rescored with ``rescore``.
+
+    Inside the API, ``rebuild`` runs k-means in a worker thread and swaps the
+    finished index in, so training never blocks the event loop.
+    """
+
+    def __init__(
+        self, dim=128, nprobe=8, nlist=None, exact_threshold=2000, storage="float32"
+    ):
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(
+                f"Unknown storage: {storage} (expected one of {', '.join(STORAGE_DTYPES)})"
+            )
+        self.dim = dim
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.exact_threshold = exact_threshold
+        self.storage = storage
+        self._scale = np.full(dim, 1 / 127, dtype=np.float32)
+        self._rebuild_lock = asyncio.Lock()
+        # การเปลี่ยนแปลงที่เกิดระหว่าง rebuild ใน thread จะถูกเล่นซ้ำบน index ใหม่ก่อนสลับ
+        self._journal = None
+        self._retrain_task = None
+        self._reset()
+
+    def _reset(self):
+        self._vectors = np.empty((0, self.dim), dtype=STORAGE_DTYPES[self.storage])
+        self._alive = np.empty(0, dtype=bool)
+        self._size = 0
+        self._ids = []
+        self._codes = []
+        self._rows = {}
+        self._centroids = None
+        self._lists = []
+        self._trained_size = 0
+        self.ready = False
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def nbytes(self):
+        return self._vectors.nbytes
+
+    @property
+    def compressed(self):
+        """True when scores are approximate enough to need ``rescore``."""
+        return self.storage == "int8"
+
+    def _encode(self, vectors):
+        if self.storage == "int8":
+            codes = np.rint(vectors / self._scale)
+            return np.clip(codes, -127, 127).astype(np.int8)
+        return vectors.astype(self._vectors.dtype)
+
+    def _decode(self, rows):
+        vectors = self._vectors[rows].astype(np.float32)
+        if self.storage == "int8":
+            vectors *= self._scale
+        return vectors
+
+    def _scores(self, rows, queries):
+        # int8: คูณ scale เข้ากับ query แทน จะได้ไม่ต้อง decode ทั้ง matrix
+        if self.storage == "int8":
+            scale = self._scale if queries.ndim == 1 else self._scale[:, None]
+            queries = queries * scale
+        if self._vectors.dtype == np.float32:
+            return self._vectors[rows] @ queries
+        # แปลงเป็น float32 ทีละ block ให้ buffer ชั่วคราวอยู่ใน cache ไม่ต้อง copy ทั้ง matrix
+        scores = np.empty((len(rows),) + queries.shape[1:], dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block = rows[start : start + SCORE_BLOCK_ROWS]
+            scores[start : start + len(block)] = (
+                self._vectors[block].astype(np.float32) @ queries
+            )
+        return scores
+
+    def build(self, items):
+        """Replace the index contents with ``(id, product_code, vector)`` items."""
+        items = list(items)
+        self._reset()
+        if self.storage == "int8" and items:
+            vectors = _normalize([vector for _, _, vector in items]).reshape(
+                -1, self.dim
+            )
+            # scale ต่อมิติจากค่าสูงสุดของข้อมูลจริง ค่าที่เพิ่มทีหลังแล้วเกินจะถูก clip
+            self._scale = np.maximum(np.abs(vectors).max(axis=0), 1e-6) / 127
+        self.add_many(items, train=False)
+        self._train()
+        self.ready = True
+
+    def _empty_like(self):
+        return VectorIndex(
+            self.dim, self.nprobe, self.nlist, self.exact_threshold, self.storage
+        )
+
+    def _copy(self):
+        # สำเนาเฉพาะแถวที่ยังอยู่ ให้ thread เทรนได้โดยไม่แตะ array ที่ search ใช้อยู่
+        fresh = self._empty_like()
+        rows = np.flatnonzero(self._alive[: self._size])
+        fresh._scale = self._scale.copy()
+        fresh._vectors = self._vectors[rows].copy()
+        fresh._alive = np.ones(len(rows), dtype=bool)
+        fresh._ids = [self._ids[r] for r in rows]
+        fresh._codes = [self._codes[r] for r in rows]
+        fresh._rows = {id: i for i, id in enumerate(fresh._ids)}
+        fresh._size = len(rows)
+        fresh.ready = True
+        return fresh
+
+    async def rebuild(self, items=None, load=None):
+        """``build`` from ``items`` (or re-train on the current contents) in a
+        worker thread, then swap the result in.
+
+        ``load`` is an async callable returning the items, for snapshots read
+        from the DB: it runs after journaling starts, so changes made while the
+        snapshot is being read are not lost.
+
+        Searches keep using the old index meanwhile; adds and removes made
+        during the rebuild are applied to both and replayed on the new one.
+        """
+        async with self._rebuild_lock:
+            self._journal = []
+            try:
+                if load is not None:
+                    items = await load()
+                if items is None:
+                    fresh = self._copy()
+                    work = fresh._train
+                else:
+                    fresh = self._empty_like()
+                    work = lambda: fresh.build(items)
+                await asyncio.to_thread(work)
+                for op, args in self._journal:
+                    getattr(fresh, op)(*args)
+            finally:
+                self._journal = None
+            self._swap(fresh)
+
+    def _swap(self, fresh):
+        for name in (
+            "_scale",
+            "_vectors",
+            "_alive",
+            "_size",
+            "_ids",
+            "_codes",
+            "_rows",
+            "_centroids",
+            "_lists",
+            "_trained_size",
+            "ready",
+        ):
+            setattr(self, name, getattr(fresh, name))
+
+    def _schedule_retrain(self):
+        if self._rebuild_lock.locked() or (
+            self._retrain_task is not None and not self._retrain_task.done()
+        ):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # ไม่มี event loop (CLI, benchmark) เทรนตรงนี้ได้เลย
+            self._train()
+            return
+        self._retrain_task = loop.create_task(self.rebuild())
+
+    def _grow(self, needed):
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        vectors = np.empty((capacity, self.dim), dtype=self._vectors.dtype)
+        vectors[: self._size] = self._vectors[: self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: self._size] = self._alive[: self._size]
+        self._vectors, self._alive = vectors, alive
+
+    def add_many(self, items, train=True):
+        items = [(str(id), code, vector) for id, code, vector in items]
+        if not items:
+            return
+        for id, _, _ in items:
+            self.remove(id)
+        if self._journal is not None:
+            self._journal.append(("add_many", (items, False)))
+
+        vectors = _normalize([vector for _, _, vector in items]).reshape(-1, self.dim)
+        start = self._size
+        self._grow(start + len(items))
+        self._vectors[start : start + len(items)] = self._encode(vectors)
+        self._alive[start : start + len(items)] = True
+        for offset, (id, code, _) in enumerate(items):
+            self._ids.append(id)
+            self._codes.append(code)
+            self._rows[id] = start + offset
+        self._size += len(items)
+
+        if train and self._needs_training():
+            # ระหว่างรอเทรนใหม่ แถวใหม่เข้า list ตาม centroid เดิมไปก่อน
+            self._schedule_retrain()
+        if self._centroids is not None:
+            rows = np.arange(start, self._size)
+            assign = np.argmax(vectors @ self._centroids.T, axis=1)
+            for c in np.unique(assign):
+                self._lists[c] = np.concatenate([self._lists[c], rows[assign == c]])
+
+    def add(self, id, product_code, vector):
+        self.add_many([(id, product_code, vector)])
+
+    def remove(self, id):
+        if self._journal is not None:
+            self._journal.append(("remove", (id,)))
+        row = self._rows.pop(str(id), None)
+        if row is not None:
+            self._alive[row] = False
+
+    def remove_product(self, product_code):
+        if self._journal is not None:
+            self._journal.append(("remove_product", (product_code,)))
+        for id in [
+            id for id, row in self._rows.items() if self._codes[row] == product_code
+        ]:
+            self.remove(id)
+
+    def _needs_training(self):
+        n = len(self._rows)
+        if self._centroids is None:
+            return n >= self.exact_threshold
+        return n > 2 * self._trained_size or n < self.exact_threshold
+
+    def _compact(self):
+        rows = np.flatnonzero(self._alive[: self._size])
+        self._vectors = self._vectors[rows].copy()
+        self._alive = np.ones(len(rows), dtype=bool)
+        self._ids = [self._ids[r] for r in rows]
+        self._codes = [self._codes[r] for r in rows]
+        self._rows = {id: i for i, id in enumerate(self._ids)}
+        self._size = len(rows)
+
+    def _train(self, iterations=10, seed=0):
+        self._compact()
+        n = self._size
+        self._trained_size = n
+        if n < self.exact_threshold:
+            self._centroids = None
+            self._lists = []
+            return
+
+        # แนะนำอย่างน้อย ~39 จุดต่อ centroid ไม่งั้น k-means ไม่นิ่ง
+        nlist = min(self.nlist or int(min(4 * math.sqrt(n), n // 39)), n)
+        vectors = self._decode(slice(0, n))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assign == c) for c in range(nlist)]
+
+    def _candidates(self, query, nprobe):
+        if self._centroids is None:
+            return np.flatnonzero(self._alive[: self._size])
+        nprobe = min(nprobe or self.nprobe, len(self._lists))
+        probe = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([self._lists[c] for c in probe])
+        return rows[self._alive[rows]]
+
+    def _top_k(self, query, rows, k):
+        if len(rows) == 0 or k <= 0:
+            return []
+        scores = self._scores(rows, query)
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Match(self._ids[rows[i]], self._codes[rows[i]], float(1 - scores[i]))
+            for i in top
+        ]
+
+    def search(self, query, k=10, nprobe=None):
+        query = _normalize(query).reshape(self.dim)
+        return self._top_k(query, self._candidates(query, nprobe), k)
+
+    def search_products(self, query, k=5, nprobe=None):
+        """Best match per product for the ``k`` closest distinct products."""
+        query = _normalize(query).reshape(self.dim)
+        nprobe = nprobe or self.nprobe
+        while True:
+            rows = self._candidates(query, nprobe)
+            matches = self._unique_products(self._scores(rows, query), rows, k)
+            # ถ้า list ที่ probe มีสินค้าไม่ครบ k ก็ขยายการค้นหาออกไปอีก
+            if len(matches) >= k or nprobe >= len(self._lists):
+                return matches
+            nprobe *= 2
+
+    def search_products_many(self, queries, k=5, nprobe=None):
+        """``search_products`` for a batch of queries.
+
+        Without IVF lists every query scans all vectors, so the scores for
+        the whole batch come from a single matrix multiply.
+        """
+        queries = _normalize(queries).reshape(-1, self.dim)
+        if self._centroids is not None:
+            return [self.search_products(query, k, nprobe) for query in queries]
+        rows = np.flatnonzero(self._alive[: self._size])
+        scores = self._scores(rows, queries.T)
+        return [
+            self._unique_products(scores[:, i], rows, k) for i in range(len(queries))
+        ]
+
+    def _unique_products(self, scores, rows, k):
+        if len(rows) == 0 or k <= 0:
+            return []
+        n = min(len(rows), 4 * k)
+        while True:
+            if n < len(rows):
+                top = np.argpartition(-scores, n - 1)[:n]
+            else:
+                top = np.arange(len(rows))
+            top = top[np.argsort(-scores[top])]
+
+            matches, seen = [], set()
+            for i in top:
+                code = self._codes[rows[i]]
+                if code in seen:
+                    continue
+                seen.add(code)
+                matches.append(Match(self._ids[rows[i]], code, float(1 - scores[i])))
+                if len(matches) == k:
+                    return matches
+            if n >= len(rows):
+                return matches
+            n = min(len(rows), n * 4)
+
+    def search_exact(self, query, k=10):
+        query = _normalize(query).reshape(self.dim)
+        return self._top_k(query, np.flatnonzero(self._alive[: self._size]), k)
+
+    def recall(self, k=10, sample=100, nprobe=None, seed=0):
+        """Mean recall@k of ``search`` against ``search_exact``.
+
+        Queries are stored vectors sampled at random, so this measures how
+        many of each image's true neighbours the probed lists still find.
+        """
+        rows = np.flatnonzero(self._alive[: self._size])
+        if len(rows) == 0:
+            return 1.0
+        rng = np.random.default_rng(seed)
+        queries = rng.choice(rows, min(sample, len(rows)), replace=False)
+        total = 0.0
+        for row in queries:
+            query = self._decode(row)
+            exact = {m.id for m in self.search_exact(query, k)}
+            approx = {m.id for m in self.search(query, k, nprobe)}
+            total += len(exact & approx) / len(exact)
+        return total / len(queries)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "vectors": len(self),
+            "lists": len(self._lists),
+            "nprobe": self.nprobe,
+            "exact": self._centroids is None,
+            "storage": self.storage,
+            "bytes": int(self.nbytes),
+        }
+
+
+def rescore(queries, candidates, vectors, k):
+    """Re-rank approximate ``candidates`` (one list of ``Match`` per query) by
+    exact cosine distance against full-precision ``vectors`` ``{id: vector}``."""
+    queries = _normalize(queries).reshape(len(candidates), -1)
+    results = []
+    for query, matches in zip(queries, candidates):
+        matches = [m for m in matches if m.id in vectors]
+        if not matches:
+            results.append([])
+            continue
+        exact = _normalize([vectors[m.id] for m in matches]) @ query
+        order = np.argsort(-exact)[:k]
+        results.append(
+            [matches[i]._replace(distance=float(1 - exact[i])) for i in order]
+        )
+    return results
+
+
+index = VectorIndex(
+    nprobe=ANN_NPROBE,
+    nlist=ANN_NLIST,
+    exact_threshold=ANN_EXACT_THRESHOLD,
+    storage=ANN_STORAGE,
+)
+_refresh_task = None
+# index ทั้งหมดที่โหลดจาก DB และ refresh พร้อมกัน: (index, model version, ตาราง)
+_indexes = [(index, MODEL_VERSION, ProductVector)]
+
+
+def register(target, version, table=ProductVector):
+    """Load and refresh ``target`` with the ``version`` vectors of ``table``
+    alongside the main index (e.g. the cascade's small-model index)."""
+    _indexes.append((target, version, table))
+
+
+async def load_from_db(target=index, version=MODEL_VERSION, table=ProductVector):
+    stmt = select(table.id, table.product_code, table.embeded).where(
+        table.model_version == version
+    )
+
+    async def snapshot():
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(stmt.execution_options(yield_per=5000))
+            return [(row.id, row.product_code, row.embeded) async for row in result]
+
+    await target.rebuild(load=snapshot)
+
+
+async def load_all():
+    for target, version, table in _indexes:
+        await load_from_db(target, version, table)
+
+
+async def _refresh_forever():
+    # ใช้เมื่อรันหลาย worker: worker อื่นเขียนข้อมูลแล้ว index ของเราจะตามทันภายในรอบถัดไป
+    while True:
+        await asyncio.sleep(ANN_REFRESH_SECONDS)
+        try:
+            await load_all()
+        except Exception:
+            # DB ล่มชั่วคราวไม่ควรทำให้ refresh หยุดไปตลอดอายุ worker
+            logger.exception("ANN index refresh failed; retrying next round")
+
+
+async def start():
+    global _refresh_task
+    if not ANN_INDEX:
+        return
+    await load_all()
+    if API_WORKERS > 1 and ANN_REFRESH_SECONDS <= 0:
+        print(
+            f"⚠️  WEB_CONCURRENCY={API_WORKERS} but ANN_REFRESH_SECONDS=0: products"
+            " added or deleted through another worker will never show up here"
+        )
+    if ANN_REFRESH_SECONDS > 0:
+        _refresh_task = asyncio.get_running_loop().create_task(_refresh_forever())
+
+
+async def stop():
+    if _refresh_task is not None:
+        _refresh_task.cancel()
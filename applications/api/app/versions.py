@@ -0,0 +1,34 @@
+import os
+from dotenv import load_dotenv
+from sqlalchemy import select
+from .database import AsyncSessionLocal
+from .products import EmbeddingVersion
+
+load_dotenv()
+
+# ต้องตรงกับ weights ที่ MODEL_PATH โหลด: search/index อ่านเฉพาะ vector ของ version นี้
+MODEL_VERSION = os.getenv("MODEL_VERSION", "v1")
+
+
+async def version_status(db, version=MODEL_VERSION):
+    """Status of ``version`` in embedding_versions, or ``None`` if it was never
+    re-indexed (vectors written directly by the API/ingest are complete)."""
+    return await db.scalar(
+        select(EmbeddingVersion.status).where(EmbeddingVersion.version == version)
+    )
+
+
+_complete = set()
+
+
+async def version_complete(version=MODEL_VERSION) -> bool:
+    """False while ``version`` is still being re-indexed. Once it is complete
+    the answer is cached, so readiness probes stop hitting the DB."""
+    if version in _complete:
+        return True
+    async with AsyncSessionLocal() as db:
+        status = await version_status(db, version)
+    if status in (None, "complete"):
+        _complete.add(version)
+        return True
+    return False
@@ -19,5 +19,51 @@ CREATE TABLE product_image_vectors (
     product_code VARCHAR(50) NOT NULL REFERENCES products(product_code),
     embeded VECTOR(128) NOT NULL,
 	image TEXT,
+    image_key VARCHAR(80),
+    model_version VARCHAR(64) NOT NULL DEFAULT 'v1',
     created_at TIMESTAMP DEFAULT NOW()
-);
\ No newline at end of file
+);
+
+CREATE INDEX product_image_vectors_embeded_hnsw_idx
+    ON product_image_vectors
+    USING hnsw (embeded vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX product_image_vectors_product_code_idx
+    ON product_image_vectors (product_code);
+
+CREATE INDEX ix_product_image_vectors_image_key
+    ON product_image_vectors (image_key);
+
+CREATE INDEX product_image_vectors_model_version_idx
+    ON product_image_vectors (model_version, id);
+
+CREATE TABLE cascade_image_vectors (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    product_code VARCHAR(50) NOT NULL REFERENCES products(product_code),
+    embeded VECTOR(128) NOT NULL,
+    image_key VARCHAR(80),
+    model_version VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX cascade_image_vectors_embeded_hnsw_idx
+    ON cascade_image_vectors
+    USING hnsw (embeded vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX cascade_image_vectors_product_code_idx
+    ON cascade_image_vectors (product_code, image_key);
+
+CREATE INDEX cascade_image_vectors_model_version_idx
+    ON cascade_image_vectors (model_version, id);
+
+CREATE TABLE embedding_versions (
+    version         VARCHAR(64) PRIMARY KEY,
+    source_version  VARCHAR(64),
+    status          VARCHAR(20) NOT NULL DEFAULT 'building',  -- building | complete
+    checkpoint      UUID,                                     -- id สุดท้ายที่ re-index แล้ว
+    processed       INTEGER NOT NULL DEFAULT 0,
+    created_at      TIMESTAMP DEFAULT NOW(),
+    updated_at      TIMESTAMP DEFAULT NOW()
+);
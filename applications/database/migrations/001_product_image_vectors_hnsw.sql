@@ -0,0 +1,12 @@
+-- HNSW index สำหรับค้นหา cosine distance บน product_image_vectors.embeded
+-- รันกับฐานข้อมูลที่สร้างจาก init.sql รุ่นก่อนหน้า:
+--   psql "$DATABASE_URL" -f applications/database/migrations/001_product_image_vectors_hnsw.sql
+-- CONCURRENTLY ไม่ lock การเขียน จึงต้องรันนอก transaction
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_image_vectors_embeded_hnsw_idx
+    ON product_image_vectors
+    USING hnsw (embeded vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_image_vectors_product_code_idx
+    ON product_image_vectors (product_code);
@@ -0,0 +1,8 @@
+-- เก็บรูปสินค้าเป็นไฟล์ใน content-addressed store แทน base64 ใน column image
+-- หลังรัน migration นี้ ให้ย้ายข้อมูลเก่าด้วย:
+--   cd applications/api && python -m app.migrate_images
+
+ALTER TABLE product_image_vectors ADD COLUMN IF NOT EXISTS image_key VARCHAR(80);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_image_vectors_image_key
+    ON product_image_vectors (image_key);
@@ -0,0 +1,19 @@
+-- ติด tag model version ให้ทุก vector เพื่อ re-index ด้วย model ใหม่ได้โดยไม่ต้องปิดระบบ
+--   cd applications/api && python -m app.reindex v2 --model-path <weights ใหม่>
+-- แล้วค่อยเปลี่ยน MODEL_VERSION/MODEL_PATH ของ API เป็น v2 และลบ v1 ด้วย --purge
+
+ALTER TABLE product_image_vectors
+    ADD COLUMN IF NOT EXISTS model_version VARCHAR(64) NOT NULL DEFAULT 'v1';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_image_vectors_model_version_idx
+    ON product_image_vectors (model_version, id);
+
+CREATE TABLE IF NOT EXISTS embedding_versions (
+    version         VARCHAR(64) PRIMARY KEY,
+    source_version  VARCHAR(64),
+    status          VARCHAR(20) NOT NULL DEFAULT 'building',  -- building | complete
+    checkpoint      UUID,                                     -- id สุดท้ายที่ re-index แล้ว
+    processed       INTEGER NOT NULL DEFAULT 0,
+    created_at      TIMESTAMP DEFAULT NOW(),
+    updated_at      TIMESTAMP DEFAULT NOW()
+);
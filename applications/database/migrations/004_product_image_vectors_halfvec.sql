@@ -0,0 +1,10 @@
+-- HNSW index บน embeded แบบ half precision: ขนาด index ราวครึ่งหนึ่งของ index เดิม
+-- เปิดใช้ฝั่ง API ด้วย PGVECTOR_HALFVEC=1 (ค้นรอบแรกด้วย halfvec แล้วจัดอันดับใหม่ด้วย vector เต็ม)
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_image_vectors_embeded_halfvec_hnsw_idx
+    ON product_image_vectors
+    USING hnsw ((embeded::halfvec(128)) halfvec_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+-- เมื่อ API ทุกตัวใช้ PGVECTOR_HALFVEC=1 แล้ว ลบ index แบบ full precision ได้เพื่อคืน memory:
+-- DROP INDEX CONCURRENTLY IF EXISTS product_image_vectors_embeded_hnsw_idx;
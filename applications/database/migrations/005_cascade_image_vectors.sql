@@ -0,0 +1,37 @@
+-- vector ของ model เล็ก (cascade) แยกออกจาก product_image_vectors
+-- คนละ embedding space กับ model เต็ม จึงต้องมีตารางและ HNSW index ของตัวเอง
+--   psql "$DATABASE_URL" -f applications/database/migrations/005_cascade_image_vectors.sql
+-- ถ้าตั้ง CASCADE_MODEL_VERSION เป็นค่าอื่น ให้แก้ 'small-v1' ด้านล่างให้ตรงกัน
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cascade_image_vectors (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    product_code VARCHAR(50) NOT NULL REFERENCES products(product_code),
+    embeded VECTOR(128) NOT NULL,
+    image_key VARCHAR(80),
+    model_version VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- ย้ายแถวของ model เล็กที่เคยเขียนลง product_image_vectors มาไว้ตารางใหม่
+INSERT INTO cascade_image_vectors (id, product_code, embeded, image_key, model_version, created_at)
+SELECT id, product_code, embeded, image_key, model_version, created_at
+FROM product_image_vectors
+WHERE model_version = 'small-v1'
+ON CONFLICT (id) DO NOTHING;
+
+DELETE FROM product_image_vectors WHERE model_version = 'small-v1';
+
+CREATE INDEX IF NOT EXISTS cascade_image_vectors_embeded_hnsw_idx
+    ON cascade_image_vectors
+    USING hnsw (embeded vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX IF NOT EXISTS cascade_image_vectors_product_code_idx
+    ON cascade_image_vectors (product_code, image_key);
+
+CREATE INDEX IF NOT EXISTS cascade_image_vectors_model_version_idx
+    ON cascade_image_vectors (model_version, id);
+
+COMMIT;
@@ -32,7 +32,7 @@ export function ProductCard({
   const hasValidImage = isArray(imageIdList) && !isEmpty(imageIdList);
 
   const imageUrl = hasValidImage
-    ? `${config.VITE_BASE_URL}/products/image/${imageIdList[0]}`
+    ? `${config.VITE_BASE_URL}/products/image/${imageIdList[0]}?size=512`
     : 'https://placehold.co/600x400?text=No+Image';
 
   return (
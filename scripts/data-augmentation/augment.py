@@ -0,0 +1,430 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image, ImageEnhance
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_PATH = os.path.join(BASE_DIR, "data", "dataset")
+RAW_PATH = os.path.join(DATA_PATH, "Raw")
+TRAIN_PATH = os.path.join(DATA_PATH, "Train")
+BG_PATH = os.path.join(DATA_PATH, "BG")
+
+SOURCE_EXTENSIONS = (".png",)
+BG_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MANIFEST_NAME = ".augment-manifest.json"
+# เพิ่มเลขนี้เมื่อแก้ขั้นตอน augment ภาพเดิมทั้งหมดจะถูกสร้างใหม่ในรอบถัดไป
+ENGINE_VERSION = 1
+# พื้นหลังถูกย่อให้ด้านยาวไม่เกินนี้ตอนโหลด (ภาพสินค้าเล็กกว่านี้มาก)
+BG_MAX_SIDE = 1024
+# ขนาดพื้นหลังที่ blur แล้วถูกปัดขึ้นเป็นทวีคูณของค่านี้ เพื่อให้ภาพขนาดใกล้กันใช้ cache ร่วมกัน
+BG_SIZE_STEP = 32
+# เพดานหน่วยความจำของ cache พื้นหลังเบลอต่อ worker (เก็บฉบับย่อ ขยายใหม่ทุกครั้งที่ใช้)
+BG_CACHE_MAX_BYTES = 64 * 2**20
+
+DEFAULT_CONFIG = {
+    "augment_per_image": 5,
+    "background": True,
+    "blur_ksize": 121,
+    "keep_original": True,
+    # วางภาพต้นฉบับ (ไม่ augment) บนพื้นหลังเบลอแทนการคัดลอกไฟล์ (แบบ add_bg.py เดิม)
+    "original_on_background": False,
+    "seed": 0,
+}
+
+_backgrounds = []
+_blur_cache = OrderedDict()
+_blur_cache_bytes = 0
+
+
+def image_seed(base_seed, relative_path, index):
+    # seed ขึ้นกับชื่อไฟล์และลำดับเท่านั้น ผลลัพธ์จึงเหมือนเดิมไม่ว่า process ไหนจะได้งานไป
+    digest = hashlib.sha256(f"{base_seed}:{relative_path}:{index}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def augment_image(image, rng, np_rng):
+    # Flip horizontal หรือ vertical แบบสุ่ม
+    flip_type = rng.choice(["none", "horizontal", "vertical"])
+    if flip_type == "horizontal":
+        image = image.transpose(Image.FLIP_LEFT_RIGHT)
+    elif flip_type == "vertical":
+        image = image.transpose(Image.FLIP_TOP_BOTTOM)
+
+    # Rotate ภาพ ±25 องศา
+    angle = rng.uniform(-25, 25)
+    image = image.rotate(angle, expand=True)
+
+    # Scale (resize) แบบสุ่ม ±10%
+    scale_factor = rng.uniform(0.9, 1.1)
+    w, h = image.size
+    new_w, new_h = int(w * scale_factor), int(h * scale_factor)
+    image = image.resize((new_w, new_h), Image.BICUBIC)
+
+    # Translate (เลื่อนภาพ) ±10% ของขนาดภาพ
+    max_dx = int(0.1 * new_w)
+    max_dy = int(0.1 * new_h)
+    dx = rng.randint(-max_dx, max_dx)
+    dy = rng.randint(-max_dy, max_dy)
+
+    # สร้าง canvas ใหม่ขนาดเท่าเดิม แล้ววางภาพที่เลื่อน
+    canvas = Image.new("RGBA", (new_w, new_h), (0, 0, 0, 0))
+    canvas.paste(image, (dx, dy))
+
+    image = canvas
+
+    # ปรับ brightness, contrast, saturation แบบสุ่ม
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.7, 1.3))
+    image = ImageEnhance.Contrast(image).enhance(rng.uniform(0.8, 1.2))
+    image = ImageEnhance.Color(image).enhance(rng.uniform(0.8, 1.2))
+
+    # ใส่ noise เบาๆ (คิดแบบมีเครื่องหมายแล้ว clip ไม่ให้ค่าติดลบวนกลับเป็น 255)
+    if rng.random() > 0.5:
+        noise = np_rng.standard_normal(image.size[::-1] + (4,), dtype=np.float32)
+        noise *= 5
+        noise += np.asarray(image)
+        image = Image.fromarray(np.clip(noise, 0, 255, out=noise).astype(np.uint8))
+
+    return image
+
+
+def load_backgrounds(bg_folder):
+    files = sorted(
+        f for f in os.listdir(bg_folder) if f.lower().endswith(BG_EXTENSIONS)
+    )
+    if not files:
+        raise FileNotFoundError(f"❌ ไม่พบไฟล์พื้นหลังในโฟลเดอร์ {bg_folder}")
+    backgrounds = []
+    for filename in files:
+        image = Image.open(os.path.join(bg_folder, filename)).convert("RGB")
+        image.thumbnail((BG_MAX_SIDE, BG_MAX_SIDE))
+        backgrounds.append(cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR))
+    return backgrounds
+
+
+def blurred_background(index, width, height, blur_ksize):
+    """Background ``index`` stretched to ``width`` x ``height`` and blurred.
+
+    The blur runs on a copy downscaled by ``blur_ksize // 31``; upscaling a
+    heavily blurred image back loses nothing visible and skips most of the
+    cost of a 121x121 kernel. Only that small copy is cached, per size and
+    up to ``BG_CACHE_MAX_BYTES`` per worker (least recently used first out).
+    """
+    global _blur_cache_bytes
+    key = (index, width, height, blur_ksize)
+    small = _blur_cache.get(key)
+    if small is None:
+        factor = max(1, blur_ksize // 31)
+        small = cv2.resize(
+            _backgrounds[index],
+            (max(1, width // factor), max(1, height // factor)),
+            interpolation=cv2.INTER_AREA,
+        )
+        ksize = (blur_ksize // factor) | 1
+        small = cv2.GaussianBlur(small, (ksize, ksize), 0)
+        _blur_cache[key] = small
+        _blur_cache_bytes += small.nbytes
+        while _blur_cache_bytes > BG_CACHE_MAX_BYTES and len(_blur_cache) > 1:
+            _, evicted = _blur_cache.popitem(last=False)
+            _blur_cache_bytes -= evicted.nbytes
+    else:
+        _blur_cache.move_to_end(key)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def clear_background_cache():
+    global _blur_cache_bytes
+    _blur_cache.clear()
+    _blur_cache_bytes = 0
+
+
+def apply_blurred_background(image, rng, blur_ksize):
+    # image: PIL RGBA (augment แล้ว) คืนภาพ BGR ที่วางบนพื้นหลังเบลอแบบสุ่ม
+    w, h = image.size
+    bucket_w = -(-w // BG_SIZE_STEP) * BG_SIZE_STEP
+    bucket_h = -(-h // BG_SIZE_STEP) * BG_SIZE_STEP
+    index = rng.randrange(len(_backgrounds))
+    background = blurred_background(index, bucket_w, bucket_h, blur_ksize)
+    top, left = (bucket_h - h) // 2, (bucket_w - w) // 2
+    background = background[top : top + h, left : left + w]
+
+    rgba = np.asarray(image)
+    foreground = cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR)
+    alpha = cv2.cvtColor(rgba[:, :, 3], cv2.COLOR_GRAY2BGR)
+    # fg * a + bg * (1 - a) ด้วย uint8 ของ OpenCV แทนการคูณ float ทั้งภาพ
+    return cv2.add(
+        cv2.multiply(foreground, alpha, scale=1 / 255),
+        cv2.multiply(background, cv2.bitwise_not(alpha), scale=1 / 255),
+    )
+
+
+def _init_worker(bg_folder):
+    global _backgrounds
+    # แต่ละ process ทำทีละภาพ ไม่ต้องให้ OpenCV แตก thread เพิ่ม
+    cv2.setNumThreads(1)
+    _backgrounds = load_backgrounds(bg_folder) if bg_folder else []
+
+
+def _composite_original(config):
+    return (
+        config["keep_original"]
+        and config["background"]
+        and config["original_on_background"]
+    )
+
+
+def output_names(filename, config):
+    base_name = os.path.splitext(filename)[0]
+    extension = ".jpg" if config["background"] else ".png"
+    names = []
+    if config["keep_original"]:
+        names.append(base_name + ".jpg" if _composite_original(config) else filename)
+    names += [
+        f"{base_name}_aug{i + 1}{extension}" for i in range(config["augment_per_image"])
+    ]
+    return names
+
+
+def process_image(input_path, output_dir, relative_path, config):
+    """Write the original copy and every augmented version of one image.
+
+    Returns the number of images written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    filename = os.path.basename(input_path)
+    names = output_names(filename, config)
+    image = Image.open(input_path).convert("RGBA")
+    if _composite_original(config):
+        rng = random.Random(image_seed(config["seed"], relative_path, "original"))
+        composite = apply_blurred_background(image, rng, config["blur_ksize"])
+        cv2.imwrite(os.path.join(output_dir, names.pop(0)), composite)
+    elif config["keep_original"]:
+        shutil.copyfile(input_path, os.path.join(output_dir, names.pop(0)))
+
+    for i, out_filename in enumerate(names):
+        seed = image_seed(config["seed"], relative_path, i)
+        rng = random.Random(seed)
+        augmented = augment_image(image, rng, np.random.default_rng(seed))
+        out_path = os.path.join(output_dir, out_filename)
+        if config["background"]:
+            composite = apply_blurred_background(augmented, rng, config["blur_ksize"])
+            cv2.imwrite(out_path, composite)
+        else:
+            augmented.save(out_path)
+    return len(names) + int(config["keep_original"])
+
+
+def _process_job(job):
+    relative_path, input_path, output_dir, config = job
+    return relative_path, process_image(input_path, output_dir, relative_path, config)
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def config_hash(config, bg_folder):
+    # config ที่มีผลต่อภาพผลลัพธ์ รวมถึงไฟล์พื้นหลังที่ใช้
+    payload = {"engine": ENGINE_VERSION, **config}
+    if not payload["original_on_background"]:
+        # ค่า default ไม่ใส่ใน hash: manifest ที่สร้างก่อนมี option นี้ยังใช้ต่อได้
+        del payload["original_on_background"]
+    if config["background"]:
+        payload["backgrounds"] = {
+            name: file_hash(os.path.join(bg_folder, name))
+            for name in sorted(os.listdir(bg_folder))
+            if name.lower().endswith(BG_EXTENSIONS)
+        }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def find_sources(input_root):
+    """``(class_name/filename, path)`` for every source image under ``input_root``."""
+    sources = []
+    for class_name in sorted(os.listdir(input_root)):
+        class_path = os.path.join(input_root, class_name)
+        if not os.path.isdir(class_path):
+            continue
+        for filename in sorted(os.listdir(class_path)):
+            if filename.lower().endswith(SOURCE_EXTENSIONS):
+                sources.append(
+                    (f"{class_name}/{filename}", os.path.join(class_path, filename))
+                )
+    return sources
+
+
+def load_manifest(output_root):
+    try:
+        with open(os.path.join(output_root, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(output_root, manifest):
+    # เขียนไฟล์ชั่วคราวแล้ว rename ถ้าโดน kill กลางทาง manifest เดิมยังอยู่ครบ
+    path = os.path.join(output_root, MANIFEST_NAME)
+    os.makedirs(output_root, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _remove_outputs(output_root, relative_paths):
+    for relative_path in relative_paths:
+        try:
+            os.remove(os.path.join(output_root, relative_path))
+        except FileNotFoundError:
+            pass
+
+
+def augment_dataset(
+    input_root=RAW_PATH,
+    output_root=TRAIN_PATH,
+    bg_folder=BG_PATH,
+    config=None,
+    workers=None,
+    force=False,
+):
+    """Augment every ``input_root/<class>/<image>.png`` into ``output_root``.
+
+    Only images whose content or whose config changed since the last run
+    (tracked in ``output_root/.augment-manifest.json``) are regenerated;
+    outputs of deleted sources are removed. Returns ``(images written,
+    seconds)``.
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    config_key = config_hash(config, bg_folder)
+    manifest = load_manifest(output_root)
+    sources = find_sources(input_root)
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(bg_folder if config["background"] else None,),
+    )
+    try:
+        hashes = dict(
+            zip(
+                (relative_path for relative_path, _ in sources),
+                pool.map(file_hash, [path for _, path in sources], chunksize=16),
+            )
+        )
+
+        # source ที่ถูกลบไปแล้ว: ลบผลลัพธ์เก่าทิ้ง
+        for relative_path in set(manifest) - set(hashes):
+            _remove_outputs(output_root, manifest.pop(relative_path)["outputs"])
+
+        jobs = []
+        for relative_path, input_path in sources:
+            class_name, filename = relative_path.split("/", 1)
+            outputs = [
+                f"{class_name}/{name}" for name in output_names(filename, config)
+            ]
+            entry = manifest.get(relative_path)
+            up_to_date = (
+                not force
+                and entry is not None
+                and entry["source"] == hashes[relative_path]
+                and entry["config"] == config_key
+                and all(os.path.exists(os.path.join(output_root, o)) for o in outputs)
+            )
+            if up_to_date:
+                continue
+            if entry is not None:
+                _remove_outputs(output_root, set(entry["outputs"]) - set(outputs))
+            manifest[relative_path] = {
+                "source": hashes[relative_path],
+                "config": None,
+                "outputs": outputs,
+            }
+            output_dir = os.path.join(output_root, class_name)
+            jobs.append((relative_path, input_path, output_dir, config))
+
+        print(f"Skipping {len(sources) - len(jobs)} source images that are up to date")
+        written = 0
+        for done, (relative_path, count) in enumerate(
+            pool.map(_process_job, jobs, chunksize=4), start=1
+        ):
+            manifest[relative_path]["config"] = config_key
+            written += count
+            if done % 50 == 0 or done == len(jobs):
+                save_manifest(output_root, manifest)
+                elapsed = time.perf_counter() - started
+                print(
+                    f"✅ {done}/{len(jobs)} source images,"
+                    f" {written} written ({written / elapsed:.1f} images/s)"
+                )
+        save_manifest(output_root, manifest)
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return written, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Augment product cut-outs onto blurred backgrounds for training"
+    )
+    parser.add_argument("input_root", nargs="?", default=RAW_PATH)
+    parser.add_argument("output_root", nargs="?", default=TRAIN_PATH)
+    parser.add_argument("--bg", default=BG_PATH)
+    parser.add_argument(
+        "--augment-per-image", type=int, default=DEFAULT_CONFIG["augment_per_image"]
+    )
+    parser.add_argument("--blur-ksize", type=int, default=DEFAULT_CONFIG["blur_ksize"])
+    parser.add_argument(
+        "--no-background",
+        action="store_true",
+        help="augment only and keep transparency (PNG output)",
+    )
+    parser.add_argument("--no-original", action="store_true")
+    parser.add_argument(
+        "--original-on-background",
+        action="store_true",
+        help="composite the un-augmented original onto a blurred background"
+        " (JPEG) instead of copying it; with --augment-per-image 0 this is the"
+        " old add_bg.py output",
+    )
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG["seed"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="regenerate every image")
+    args = parser.parse_args(argv)
+    if args.original_on_background and args.no_background:
+        parser.error("--original-on-background needs backgrounds")
+
+    config = {
+        "augment_per_image": args.augment_per_image,
+        "background": not args.no_background,
+        "blur_ksize": args.blur_ksize | 1,
+        "keep_original": not args.no_original,
+        "original_on_background": args.original_on_background,
+        "seed": args.seed,
+    }
+    written, elapsed = augment_dataset(
+        args.input_root,
+        args.output_root,
+        args.bg,
+        config,
+        workers=args.workers,
+        force=args.force,
+    )
+    rate = written / elapsed if elapsed else 0.0
+    print(f"Done: {written} images in {elapsed:.1f}s ({rate:.1f} images/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+import torch
+import cv2
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+import augment
+from augment import RAW_PATH, BG_PATH, augment_image, image_seed
+
+IMAGE_SIZE = (224, 224)
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+# ภาพต้นฉบับถูกย่อให้ด้านยาวไม่เกินนี้ตอนโหลด สุดท้ายก็ถูกย่อเหลือ 224 อยู่ดี
+SOURCE_MAX_SIDE = 512
+
+
+def _pack(arrays):
+    """One shared-memory uint8 tensor holding every array, plus their
+    (offset, shape). Workers read views into it instead of private copies."""
+    sizes = [a.size for a in arrays]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(int).tolist()
+    buffer = torch.empty(sum(sizes), dtype=torch.uint8)
+    flat = buffer.numpy()
+    for array, offset in zip(arrays, offsets):
+        flat[offset : offset + array.size] = array.reshape(-1)
+    return buffer.share_memory_(), list(zip(offsets, [a.shape for a in arrays]))
+
+
+def _view(buffer, entry):
+    offset, shape = entry
+    return buffer[offset : offset + int(np.prod(shape))].numpy().reshape(shape)
+
+
+class AugmentedProductDataset(Dataset):
+    """Augments raw product cut-outs on the fly instead of reading
+    materialised files from data/dataset/Train.
+
+    Applies the same flips, rotation, scale, translation, colour jitter,
+    noise and blurred background as ``augment.py``. Raw images (capped at
+    ``SOURCE_MAX_SIDE``) and backgrounds are decoded once and kept in
+    shared memory. Each epoch has ``augment_per_image`` augmented views
+    (plus the original when ``keep_original``) of every raw image, and the
+    views change with ``set_epoch`` while staying reproducible for a given
+    ``seed``. The epoch lives in shared memory, so ``set_epoch`` also
+    reaches workers that are already running (``persistent_workers``);
+    call it before iterating the loader for that epoch.
+
+    Items are ``(tensor, class_index)`` with the API's 224x224 ImageNet
+    normalisation.
+    """
+
+    def __init__(
+        self,
+        input_root=RAW_PATH,
+        bg_folder=BG_PATH,
+        augment_per_image=5,
+        keep_original=True,
+        blur_ksize=121,
+        seed=0,
+        image_size=IMAGE_SIZE,
+    ):
+        self.augment_per_image = augment_per_image
+        self.keep_original = keep_original
+        self.blur_ksize = blur_ksize
+        self.seed = seed
+        self.image_size = image_size
+        # อยู่ใน shared memory: worker ที่ fork/spawn ไปแล้วเห็นค่าที่ set_epoch ตั้งทีหลังด้วย
+        self._epoch = torch.zeros(1, dtype=torch.long).share_memory_()
+        self._background_views = None
+
+        sources = augment.find_sources(input_root)
+        self.classes = sorted({path.split("/", 1)[0] for path, _ in sources})
+        class_index = {name: i for i, name in enumerate(self.classes)}
+        self.names = [relative_path for relative_path, _ in sources]
+        self.labels = [class_index[path.split("/", 1)[0]] for path in self.names]
+
+        images, self.blur_scales = [], []
+        for _, path in sources:
+            image = Image.open(path).convert("RGBA")
+            width = image.width
+            image.thumbnail((SOURCE_MAX_SIDE, SOURCE_MAX_SIDE))
+            # blur ของพื้นหลังต้องย่อตามภาพ ให้เบลอเท่ากับตอนทำกับภาพขนาดเต็ม
+            self.blur_scales.append(image.width / width)
+            images.append(np.asarray(image))
+        self._images, self._image_entries = _pack(images)
+        self._backgrounds, self._background_entries = _pack(
+            augment.load_backgrounds(bg_folder)
+        )
+
+    @property
+    def epoch(self):
+        return int(self._epoch[0])
+
+    def set_epoch(self, epoch):
+        self._epoch[0] = epoch
+
+    def __len__(self):
+        return len(self.names) * (self.augment_per_image + int(self.keep_original))
+
+    def _attach_backgrounds(self):
+        # ครั้งแรกใน worker แต่ละตัว: ให้ augment.py ใช้ view ของ shared memory เป็นพื้นหลัง
+        if augment._backgrounds is not self._background_views:
+            self._background_views = [
+                _view(self._backgrounds, entry) for entry in self._background_entries
+            ]
+            augment._backgrounds = self._background_views
+            augment.clear_background_cache()
+
+    def _to_tensor(self, rgb):
+        height, width = self.image_size
+        resized = cv2.resize(rgb, (width, height), interpolation=cv2.INTER_AREA)
+        out = torch.empty((3, height, width))
+        target = out.numpy()
+        target[:] = resized.transpose(2, 0, 1)
+        target *= (1 / (255 * STD))[:, None, None]
+        target -= (MEAN / STD)[:, None, None]
+        return out
+
+    def __getitem__(self, index):
+        self._attach_backgrounds()
+        source = index % len(self.names)
+        variant = index // len(self.names)
+        pixels = _view(self._images, self._image_entries[source])
+
+        if self.keep_original and variant == 0:
+            # แบบเดียวกับ PIL convert("RGB") ของภาพต้นฉบับใน Train
+            return (
+                self._to_tensor(np.ascontiguousarray(pixels[:, :, :3])),
+                self.labels[source],
+            )
+
+        seed = image_seed(self.seed, f"{self.epoch}:{self.names[source]}", variant)
+        rng = random.Random(seed)
+        augmented = augment_image(
+            Image.fromarray(pixels, "RGBA"), rng, np.random.default_rng(seed)
+        )
+        ksize = max(3, int(self.blur_ksize * self.blur_scales[source])) | 1
+        composite = augment.apply_blurred_background(augmented, rng, ksize)
+        rgb = cv2.cvtColor(composite, cv2.COLOR_BGR2RGB)
+        return self._to_tensor(rgb), self.labels[source]
+
+
+def _model_step_rate(batch_size, steps=5):
+    # เวลา forward + backward ของ ResNet18 บน CPU ไว้เทียบว่า loader ส่งภาพทันหรือไม่
+    import torchvision
+
+    model = torchvision.models.resnet18(weights=None)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01)
+    batch = torch.randn(batch_size, 3, *IMAGE_SIZE)
+    labels = torch.zeros(batch_size, dtype=torch.long)
+    for step in range(steps + 1):
+        if step == 1:
+            started = time.perf_counter()
+        optimizer.zero_grad()
+        torch.nn.functional.cross_entropy(model(batch), labels).backward()
+        optimizer.step()
+    return steps * batch_size / (time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure how fast the on-the-fly augmentation dataset feeds training"
+    )
+    parser.add_argument("input_root", nargs="?", default=RAW_PATH)
+    parser.add_argument("--bg", default=BG_PATH)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument(
+        "--compare-model",
+        action="store_true",
+        help="also time a ResNet18 training step on the same CPU",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    dataset = AugmentedProductDataset(args.input_root, args.bg)
+    print(
+        f"Loaded {len(dataset.names)} images of {len(dataset.classes)} classes"
+        f" into shared memory in {time.perf_counter() - started:.1f}s"
+        f" ({dataset._images.numel() / 2**20:.1f} MB)"
+    )
+
+    loader = DataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        shuffle=True,
+        num_workers=args.workers,
+        persistent_workers=args.workers > 0,
+    )
+    images = 0
+    batches = iter(loader)
+    next(batches)  # worker เริ่มทำงาน ไม่นับรวม
+    started = time.perf_counter()
+    for _, (batch, _) in zip(range(args.batches), batches):
+        images += len(batch)
+    rate = images / (time.perf_counter() - started)
+    print(f"Loader: {rate:.1f} images/s with {args.workers} workers")
+
+    if args.compare_model:
+        step_rate = _model_step_rate(args.batch_size)
+        print(f"ResNet18 training step: {step_rate:.1f} images/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())